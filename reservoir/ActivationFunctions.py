@@ -1,23 +1,31 @@
 import numpy as np
 from scipy.special import expit
 
+# The activation functions take an optional output array, so that the recurrence can be evaluated in place
+
 class HyperbolicTangent(object):
-    def __call__(self, x):
-        return np.tanh(x)
+    def __call__(self, x, out=None):
+        return np.tanh(x, out=out)
 
 
 class LogisticFunction(object):
     def __init__(self, beta=1.0):
         self.beta = beta
 
-    def __call__(self, x):
-        return expit(self.beta * x)
+    def __call__(self, x, out=None):
+        if out is None:
+            return expit(self.beta * x)
+        np.multiply(x, self.beta, out=out)
+        return expit(out, out=out)
 
 
 class ReLU(object):
-    def __call__(self, x):
-        return np.maximum(x, np.zeros(x.shape))
+    def __call__(self, x, out=None):
+        return np.maximum(x, 0.0, out=out)
 
 class Linear(object):
-    def __call__(self, x):
-        return x
\ No newline at end of file
+    def __call__(self, x, out=None):
+        if out is None or out is x:
+            return x
+        out[...] = x
+        return out
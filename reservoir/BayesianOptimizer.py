@@ -0,0 +1,169 @@
+import numpy as np
+import scipy.linalg as la
+from scipy import optimize
+from scipy.stats import norm
+from reservoir import Parallel as parallel
+
+# Gaussian process surrogate with expected improvement - for objectives where every evaluation trains and validates
+# a reservoir, so a few dozen well chosen evaluations beat thousands of blind ones
+
+
+class GaussianProcess(object):
+    """
+    Gaussian process regression with a Matern 5/2 kernel (one length scale per dimension) and a noise term. The
+    hyper-parameters are fitted by maximising the marginal likelihood.
+    """
+    def __init__(self, restarts=3, seed=None):
+        self.restarts = restarts
+        self.random = np.random.RandomState(seed)
+
+    def __kernel(self, A, B, lengthScales, signal):
+        distance = np.sqrt(np.maximum(np.sum(((A[:, None, :] - B[None, :, :]) / lengthScales) ** 2, axis=2), 0.0))
+        scaled = np.sqrt(5.0) * distance
+        return signal * (1.0 + scaled + scaled ** 2 / 3.0) * np.exp(-scaled)
+
+    def __unpack(self, parameters):
+        d = self.X.shape[1]
+        return np.exp(parameters[:d]), np.exp(parameters[d]), np.exp(parameters[d + 1])
+
+    def __negativeLogLikelihood(self, parameters):
+        lengthScales, signal, noise = self.__unpack(parameters)
+        K = self.__kernel(self.X, self.X, lengthScales, signal) + (noise + 1e-10) * np.identity(self.X.shape[0])
+        try:
+            factor = la.cho_factor(K, lower=True)
+        except la.LinAlgError:
+            return 1e10
+        alpha = la.cho_solve(factor, self.y)
+        return 0.5 * np.dot(self.y, alpha) + np.sum(np.log(np.diag(factor[0])))
+
+    def fit(self, X, y):
+        """
+        :param X: N X d - inputs scaled to the unit box
+        :param y: N
+        """
+        self.X = X
+        self.mean = np.mean(y)
+        self.scale = np.std(y) if np.std(y) > 0.0 else 1.0
+        self.y = (y - self.mean) / self.scale
+
+        # log length scales, log signal variance, log noise variance
+        d = X.shape[1]
+        bounds = [(np.log(1e-2), np.log(10.0))] * d + [(np.log(1e-2), np.log(10.0)), (np.log(1e-6), np.log(1.0))]
+        best = None
+        for i in range(self.restarts):
+            start = np.array([self.random.uniform(low, high) for low, high in bounds])
+            result = optimize.minimize(self.__negativeLogLikelihood, start, method="L-BFGS-B", bounds=bounds)
+            if best is None or result.fun < best.fun:
+                best = result
+
+        self.lengthScales, self.signal, self.noise = self.__unpack(best.x)
+        K = self.__kernel(X, X, self.lengthScales, self.signal) + (self.noise + 1e-10) * np.identity(X.shape[0])
+        self.factor = la.cho_factor(K, lower=True)
+        self.alpha = la.cho_solve(self.factor, self.y)
+        return self
+
+    def predict(self, X):
+        """
+        :return: posterior mean and standard deviation at X (N X d)
+        """
+        Ks = self.__kernel(X, self.X, self.lengthScales, self.signal)
+        mean = np.dot(Ks, self.alpha)
+        v = la.cho_solve(self.factor, Ks.T)
+        variance = np.maximum(self.signal - np.sum(Ks * v.T, axis=1), 1e-12)
+        return mean * self.scale + self.mean, np.sqrt(variance) * self.scale
+
+
+def expectedImprovement(mean, deviation, best, xi=0.01):
+    improvement = best - mean - xi
+    z = improvement / deviation
+    return improvement * norm.cdf(z) + deviation * norm.pdf(z)
+
+
+def minimize(objective, bounds, evaluations=60, initialEvaluations=10, candidates=None, seed=None, callback=None,
+             samples=2000):
+    """
+    Bayesian optimisation - after a few space filling evaluations, every next point maximises the expected
+    improvement under a Gaussian process fitted to the logarithm of the errors seen so far.
+
+    :param objective: objective(x) - x is an array of the d coordinates
+    :param bounds: d (lower, upper) pairs
+    :param evaluations: total number of objective evaluations
+    :param initialEvaluations: number of Latin hypercube (or random candidate) points before the surrogate is used
+    :param candidates: optional P X d points (eg. the grid of a brute tuner) - only these are evaluated
+    :param seed: seed of the initial design and the acquisition sampling
+    :param callback: callback(x, error) - called after every evaluation
+    :param samples: number of random points the expected improvement is maximised over (continuous case)
+    :return: xmin (scalar for one dimensional problems, as optimize.brute), Jmin, evaluated points, their errors
+    """
+    random = np.random.RandomState(seed)
+    lower, upper = np.array(bounds, dtype=float).T
+    d = lower.shape[0]
+    width = np.where(upper > lower, upper - lower, 1.0)
+    if candidates is not None:
+        evaluations = min(evaluations, candidates.shape[0])
+    initialEvaluations = min(initialEvaluations, evaluations)
+
+    # Initial design - Latin hypercube, or distinct random candidates
+    if candidates is None:
+        strata = (random.rand(initialEvaluations, d) + np.array([random.permutation(initialEvaluations) for i in range(d)]).T) / initialEvaluations
+        design = lower + strata * width
+    else:
+        remaining = np.ones(candidates.shape[0], dtype=bool)
+        chosen = random.choice(candidates.shape[0], initialEvaluations, replace=False)
+        remaining[chosen] = False
+        design = candidates[chosen]
+
+    X = np.zeros((evaluations, d))
+    errors = np.zeros(evaluations)
+    surrogate = GaussianProcess(seed=random.randint(2**31 - 1))
+    for i in range(evaluations):
+        if i < initialEvaluations:
+            x = design[i]
+        else:
+            # Errors span orders of magnitude (a diverging forecast), so the surrogate models their logarithm
+            logErrors = np.log(np.clip(np.nan_to_num(errors[:i], nan=np.inf), 1e-300, 1e300))
+            surrogate.fit((X[:i] - lower) / width, logErrors)
+            best = np.min(logErrors)
+            if candidates is None:
+                points = random.rand(samples, d)
+                mean, deviation = surrogate.predict(points)
+                start = points[np.argmax(expectedImprovement(mean, deviation, best))]
+                acquisition = lambda p: -expectedImprovement(*surrogate.predict(p.reshape((1, d))), best=best)[0]
+                polished = optimize.minimize(acquisition, start, method="L-BFGS-B", bounds=[(0.0, 1.0)] * d)
+                x = lower + polished.x * width
+            else:
+                index = np.flatnonzero(remaining)
+                mean, deviation = surrogate.predict((candidates[index] - lower) / width)
+                choice = index[np.argmax(expectedImprovement(mean, deviation, best))]
+                remaining[choice] = False
+                x = candidates[choice]
+
+        X[i] = x
+        errors[i] = objective(x)
+        if callback is not None:
+            callback(x, errors[i])
+
+    best = np.argmin(errors)
+    xmin = X[best][0] if d == 1 else X[best]
+    return xmin, errors[best], X, errors
+
+
+def minimizeGrid(objective, ranges, repetitions, evaluations=60, workers=1, seed=None, callback=None, journal=None):
+    """
+    Bayesian optimisation over the grid of a brute tuner - every evaluation averages the repetitions of the
+    objective with a Parallel.TrialEvaluator
+
+    :param objective: objective(x, count) - average error of count trials at grid point x
+    :param ranges: tuple of slices, as in optimize.brute
+    :param journal: optional Journal - a restarted search replays the recorded evaluations
+    :return: as minimize
+    """
+    grid, points = parallel.gridPoints(ranges)
+    seed = parallel.sessionSeed(journal, seed, evaluations * repetitions)
+    with parallel.TrialEvaluator(objective, workers, journal=journal) as evaluator:
+        evaluated = []
+        def trials(x):
+            evaluated.append(x)
+            return evaluator.evaluate(x.reshape((1, -1)), repetitions, seed + len(evaluated) * repetitions)[0]
+        bounds = list(zip(np.min(points, axis=0), np.max(points, axis=0)))
+        return minimize(trials, bounds, evaluations=evaluations, candidates=points, seed=seed, callback=callback)
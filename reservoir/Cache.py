@@ -0,0 +1,63 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import scipy.sparse as sparse
+
+
+def fingerprint(*items):
+    """
+    Computes a digest of the given items - numpy arrays, scipy sparse matrices and plain (hashable) values.
+    Arrays are hashed by their dtype, shape and raw bytes, so two equal matrices always get the same fingerprint.
+    """
+    digest = hashlib.sha1()
+    for item in items:
+        if sparse.issparse(item):
+            item = sparse.csr_matrix(item)
+            digest.update(b"csr" + str(item.shape).encode())
+            for array in (item.data, item.indices, item.indptr):
+                digest.update(np.ascontiguousarray(array).view(np.uint8))
+        elif isinstance(item, np.ndarray):
+            digest.update((str(item.dtype) + str(item.shape)).encode())
+            digest.update(np.ascontiguousarray(item).view(np.uint8))
+        else:
+            digest.update(repr(item).encode())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+
+class LRUCache(object):
+    """
+    A dictionary bounded by maxSize - the least recently used entry is evicted first
+    """
+    def __init__(self, maxSize=128):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        # Drop a single entry or, without a key, the whole cache
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
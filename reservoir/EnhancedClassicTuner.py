@@ -1,16 +1,51 @@
 from scipy import optimize
-from reservoir import classicESN, ReservoirTopology as topology
+from reservoir import classicESN, ReservoirTopology as topology, SpectralRadius as radius, Cache as cache, Parallel as parallel
+from reservoir import BayesianOptimizer as bayes, Trace as trace
+from reservoir.Journal import Journal
+from reservoir.TopologyPool import TopologyPool, Topology
 from performance import ErrorMetrics as metrics
 import numpy as np
 from reservoir import Utility as util
 from enum import Enum
 import gc
 import decimal
+import functools
+import itertools
 
 class Minimizer(Enum):
     BasinHopping = 1
     DifferentialEvolution = 2
     BruteForce = 3
+    SuccessiveHalving = 4
+    Bayesian = 5
+
+def fidelityBudget(fidelity, trainingLength, horizon, minimumTrainingLength):
+    """
+    Budget of an evaluation at a fidelity in (0, 1] - the most recent part of the training data (so the reservoir
+    still ends in the state the forecast starts from) and the first steps of the validation horizon
+    :return: training length, horizon
+    """
+    trainingLength = min(trainingLength, max(minimumTrainingLength, int(np.ceil(trainingLength * fidelity))))
+    horizon = max(1, int(np.ceil(horizon * fidelity)))
+    return trainingLength, horizon
+
+
+def refineShortlist(objective, points, errors, shortlist, repetitions, fidelity, chunkSize=10, workers=1, seed=None,
+                    callback=None, journal=None):
+    """
+    Final stage of a multi-fidelity search - the shortlist best points of the low fidelity search are evaluated again
+    by successive halving, from the search fidelity up to full fidelity
+    :param objective: objective(x, count, fidelity)
+    :return: as parallel.successiveHalving
+    """
+    # Distinct points only - a search may evaluate a point more than once
+    points, first = np.unique(points, axis=0, return_index=True)
+    errors = errors[first]
+    best = np.sort(np.argsort(errors, kind='stable')[:shortlist])
+    return parallel.successiveHalving(objective, points[best], repetitions, minimumFidelity=fidelity,
+                                      chunkSize=chunkSize, workers=workers, seed=seed, callback=callback,
+                                      journal=journal)
+
 
 class ParameterStep(object):
     def __init__(self, stepsize=0.005):
@@ -19,13 +54,32 @@ class ParameterStep(object):
         x += self.stepsize
         return x
 
-class ReservoirParameterTuner:
+class ReservoirParameterTuner(parallel.SharesArrays):
     def __init__(self, size, initialTransient, trainingInputData, trainingOutputData,
                  initialSeed, validationOutputData, spectralRadiusBound, inputScalingBound,
                  reservoirScalingBound, leakingRateBound,inputWeightMatrix=None,
                  reservoirWeightMatrix=None, minimizer=Minimizer.DifferentialEvolution,
-                 initialGuess = np.array([0.79, 0.5, 0.5, 0.3])):
+                 initialGuess = np.array([0.79, 0.5, 0.5, 0.3]), dtype=np.float64, workers=1, seed=None,
+                 candidates=81, evaluations=60, journal=None, fidelity=1.0, shortlist=9,
+                 trace=None, traceMemory=False):
+        """
+        :param workers: number of processes evaluating the differential evolution population (or the successive
+                        halving candidates) - the data and weight matrices are placed in shared memory once
+        :param seed: seed of the differential evolution - with a seed, the result is the same for any number of workers
+        :param candidates: number of random parameter sets the successive halving starts with
+        :param evaluations: number of reservoirs trained by the Bayesian optimisation
+        :param journal: file name of the evaluation journal - a restarted tuner with the same journal replays the
+                        recorded evaluations and continues where it stopped
+        :param fidelity: fidelity of the differential evolution - below 1 the population is evaluated on the most
+                         recent part of the training data and a shorter validation horizon (see fidelityBudget), and
+                         only the shortlist best parameter sets are evaluated, with rising fidelity, on all the data
+        :param trace: file name of the evaluation trace - the phase timings and the peak resident memory of the
+                      process at every evaluation are appended to it as JSON lines (see Trace.printSummary)
+        :param traceMemory: also trace the peak memory allocated by every evaluation with tracemalloc - exact, but it
+                            slows down the evaluations (and so distorts the phase timings)
+        """
         self.size = size
+        self.dtype = dtype
         self.initialTransient = initialTransient
         self.trainingInputData = trainingInputData
         self.trainingOutputData = trainingOutputData
@@ -38,15 +92,24 @@ class ReservoirParameterTuner:
         self.horizon = self.validationOutputData.shape[0]
         self.minimizer = minimizer
         self.initialGuess = initialGuess
+        self.workers = workers
+        self.seed = seed
+        self.candidates = candidates
+        self.evaluations = evaluations
+        self.journal = journal
+        self.fidelity = fidelity
+        self.shortlist = shortlist
+        self.trace = trace
+        self.traceMemory = traceMemory
 
         if inputWeightMatrix is None:
             self.inputN, self.inputD = self.trainingInputData.shape
-            self.inputWeightRandom = np.random.rand(self.size, self.inputD)
+            self.inputWeightRandom = np.random.rand(self.size, self.inputD).astype(self.dtype)
         else:
             self.inputWeightRandom = inputWeightMatrix
 
         if reservoirWeightMatrix is None:
-            self.reservoirWeightRandom = np.random.rand(self.size, self.size)
+            self.reservoirWeightRandom = np.random.rand(self.size, self.size).astype(self.dtype)
         else:
             self.reservoirWeightRandom = reservoirWeightMatrix
 
@@ -54,8 +117,36 @@ class ReservoirParameterTuner:
         self.inputWeightRandom.flags.writeable = False
         self.reservoirWeightRandom.flags.writeable = False
 
-
-    def __reservoirTrain__(self, x):
+        # Only the scalings change between evaluations, and W_in = R_in - inputScaling * Mask_in, so the input
+        # projection of the training data is R_in U - inputScaling * Mask_in U - both terms are computed once
+        inputWeightRandom = np.asarray(self.inputWeightRandom, dtype=self.dtype)
+        trainingInputData = np.asarray(self.trainingInputData, dtype=self.dtype)
+        self.randomProjection = np.dot(trainingInputData, inputWeightRandom.T)
+        self.maskProjection = np.dot(trainingInputData, (inputWeightRandom != 0.0).T.astype(self.dtype))
+
+        # Unit spectral radius reservoir matrices, per reservoir scaling
+        self.reservoirFingerprint = cache.fingerprint(self.reservoirWeightRandom)
+        self.unitReservoirWeights = cache.LRUCache(maxSize=8)
+
+    def __unitReservoirWeight(self, reservoirScaling):
+        unitReservoirWeight = self.unitReservoirWeights.get(reservoirScaling)
+        if unitReservoirWeight is None:
+            # Same as classicESN.Reservoir - scale the non-zero elements and normalise
+            with trace.phase("spectral"):
+                reservoirWeightRandom = np.asarray(self.reservoirWeightRandom, dtype=self.dtype)
+                unitReservoirWeight = np.where(reservoirWeightRandom != 0.0, reservoirWeightRandom - reservoirScaling, 0.0).astype(self.dtype)
+                rad = radius.cachedSpectralRadius(unitReservoirWeight, self.reservoirFingerprint, reservoirScaling, radius.EigenValues())
+                unitReservoirWeight /= float(rad)
+            self.unitReservoirWeights.put(reservoirScaling, unitReservoirWeight)
+        return unitReservoirWeight
+
+
+    @trace.traced
+    def __reservoirTrain__(self, x, fidelity=1.0):
+
+        # Train on the most recent part of the training data and validate on the first steps of the validation data
+        trainingLength, horizon = fidelityBudget(fidelity, self.trainingInputData.shape[0], self.horizon,
+                                                 self.initialTransient + self.size)
 
         #Extract the parameters
         spectralRadius = x[0]
@@ -70,41 +161,114 @@ class ReservoirParameterTuner:
                                   reservoirScaling=reservoirScaling,
                                   leakingRate=leakingRate,
                                   initialTransient=self.initialTransient,
-                                  inputData=self.trainingInputData,
-                                  outputData=self.trainingOutputData,
+                                  inputData=self.trainingInputData[-trainingLength:],
+                                  outputData=self.trainingOutputData[-trainingLength:],
                                   inputWeightRandom=self.inputWeightRandom,
-                                  reservoirWeightRandom=self.reservoirWeightRandom)
+                                  dtype=self.dtype,
+                                  inputProjection=self.randomProjection[-trainingLength:]
+                                                  - float(inputScaling) * self.maskProjection[-trainingLength:],
+                                  unitReservoirWeight=self.__unitReservoirWeight(reservoirScaling))
 
         #Train the reservoir
         res.trainReservoir()
 
         # Warm up
-        predictedTrainingOutputData = res.predict(self.trainingInputData[-self.initialTransient:])
+        with trace.phase("warmup"):
+            predictedTrainingOutputData = res.predict(self.trainingInputData[-self.initialTransient:])
 
         #Predict for the validation data
-        predictedOutputData = util.predictFuture(res, self.initialSeed, self.horizon)
+        with trace.phase("forecast"):
+            predictedOutputData = util.predictFuture(res, self.initialSeed, horizon)
 
-        gc.collect()
+        with trace.phase("gc"):
+            gc.collect()
 
         #Calcuate the regression error
         errorFunction = metrics.MeanSquareError()
-        regressionError = errorFunction.compute(self.validationOutputData, predictedOutputData)
+        regressionError = errorFunction.compute(self.validationOutputData[:horizon], predictedOutputData)
 
         #Return the error
         #print("\nThe Parameters: "+str(x)+" Regression error:"+str(regressionError))
         return regressionError
 
+    def __trialsError__(self, x, times, fidelity):
+        # The weight matrices are fixed, so every trial gives the same error
+        return self.__reservoirTrain__(x, fidelity)
+
+    def __successiveHalving__(self, bounds, journal=None):
+        # A resumed run draws the same candidates
+        seed = parallel.sessionSeed(journal, self.seed, self.candidates)
+        lower, upper = np.array(bounds, dtype=float).T
+        points = lower + (upper - lower) * np.random.RandomState(seed).rand(self.candidates, len(bounds))
+        if self.workers > 1:
+            self.shareArrays()
+        try:
+            return parallel.successiveHalving(self.__trialsError__, points, repetitions=1, chunkSize=1,
+                                              workers=self.workers, seed=seed, journal=journal)
+        finally:
+            self.releaseArrays()
+
+    def __differentialEvolution__(self, bounds, journal=None):
+        # The population is evaluated as a whole (deferred updating), so that the serial and parallel runs agree - and
+        # a resumed run (same seed, replayed errors) goes through the same populations
+        seed = self.seed if journal is None else journal.sessionSeed(self.seed)
+        objective = functools.partial(self.__reservoirTrain__, fidelity=self.fidelity)
+        evaluated = []
+        if self.workers > 1:
+            self.shareArrays()
+        try:
+            with parallel.WorkerPool(self.workers, objective) as pool:
+                def evaluatePopulation(function, population):
+                    population = [np.array(x) for x in population]
+                    if journal is None:
+                        errors = pool.map(parallel.evaluate, population)
+                    else:
+                        errors = journal.map(lambda points: pool.map(parallel.timedEvaluate, points), population,
+                                             self.fidelity)
+                    evaluated.extend(zip(population, errors))
+                    return errors
+                result = optimize.differential_evolution(parallel.evaluate, bounds=bounds, seed=seed,
+                                                         updating='deferred', workers=evaluatePopulation)
+
+            # Multi-fidelity - the best parameter sets seen by the search are evaluated again on all the data
+            if self.fidelity < 1.0:
+                points = np.array([x for x, error in evaluated])
+                errors = np.array([error for x, error in evaluated])
+                result.x, result.fun, survivors, survivorErrors = refineShortlist(self.__trialsError__, points, errors,
+                                                                                  self.shortlist, 1, self.fidelity,
+                                                                                  chunkSize=1, workers=self.workers,
+                                                                                  seed=seed, journal=journal)
+            return result
+        finally:
+            self.releaseArrays()
+
     def __tune__(self):
+        # Opened for every tuning run and kept in this process - only the file name is sent to the workers
+        journal = None if self.journal is None else Journal(self.journal)
         if self.minimizer == Minimizer.DifferentialEvolution:
             bounds = [self.spectralRadiusBound, self.inputScalingBound, self.reservoirScalingBound, self.leakingRateBound]
-            result = optimize.differential_evolution(self.__reservoirTrain__,bounds=bounds)
+            result = self.__differentialEvolution__(bounds, journal)
             print("The Optimization results are :"+str(result))
             return result.x[0], result.x[1], result.x[2], result.x[3]
+        elif self.minimizer == Minimizer.SuccessiveHalving:
+            bounds = [self.spectralRadiusBound, self.inputScalingBound, self.reservoirScalingBound, self.leakingRateBound]
+            x, regressionError, survivors, errors = self.__successiveHalving__(bounds, journal)
+            print("The Optimization results are :"+str(x)+" Regression error:"+str(regressionError))
+            return x[0], x[1], x[2], x[3]
+        elif self.minimizer == Minimizer.Bayesian:
+            bounds = [self.spectralRadiusBound, self.inputScalingBound, self.reservoirScalingBound, self.leakingRateBound]
+            objective = self.__reservoirTrain__ if journal is None else journal.wrap(self.__reservoirTrain__)
+            seed = self.seed if journal is None else journal.sessionSeed(self.seed)
+            x, regressionError, evaluated, errors = bayes.minimize(objective, bounds, evaluations=self.evaluations,
+                                                                   seed=seed)
+            print("The Optimization results are :"+str(x)+" Regression error:"+str(regressionError))
+            return x[0], x[1], x[2], x[3]
         else:
             bounds = [self.spectralRadiusBound, self.inputScalingBound, self.reservoirScalingBound, self.leakingRateBound]
             minimizer_kwargs = {"method": "TNC", "bounds":bounds, "options": {"eps":0.005}}
             mytakestep = ParameterStep()
-            result = optimize.basinhopping(self.__reservoirTrain__, x0=self.initialGuess, minimizer_kwargs=minimizer_kwargs, take_step=mytakestep, stepsize=0.005)
+            objective = self.__reservoirTrain__ if journal is None else journal.wrap(self.__reservoirTrain__)
+            result = optimize.basinhopping(objective, x0=self.initialGuess, minimizer_kwargs=minimizer_kwargs, take_step=mytakestep, stepsize=0.005)
             print("The Optimization results are :"+str(result))
             return result.x[0], result.x[1], result.x[2], result.x[3]
 
@@ -115,8 +279,18 @@ class RandomConnectivityTuner:
     def __init__(self, size, initialTransient, trainingInputData, trainingOutputData,
                  initialSeed, validationOutputData, reservoirConnectivityBound = (0.1,1.0),
                  minimizer=Minimizer.DifferentialEvolution, initialGuess=0.5,
-                 spectralRadius = 0.79, inputScaling = 0.5, reservoirScaling=0.5, leakingRate=0.3):
+                 spectralRadius = 0.79, inputScaling = 0.5, reservoirScaling=0.5, leakingRate=0.3,
+                 dtype=np.float64, journal=None, ensembleSize=10):
+        """
+        :param journal: file name of the evaluation journal - a restarted tuner with the same journal replays the
+                        recorded evaluations
+        :param ensembleSize: number of reservoirs trained together (see util.averageEnsembleError) - lower it for
+                             large reservoirs, a batch holds several ensembleSize X size X size arrays
+        """
         self.size = size
+        self.dtype = dtype
+        self.journal = journal
+        self.ensembleSize = ensembleSize
         self.initialTransient = initialTransient
         self.trainingInputData = trainingInputData
         self.trainingOutputData = trainingOutputData
@@ -129,7 +303,7 @@ class RandomConnectivityTuner:
 
         # Input-to-reservoir is of Classic Type - Fully connected and maintained as constant
         self.inputN, self.inputD = self.trainingInputData.shape
-        self.inputWeight = topology.ClassicInputTopology(self.inputD, self.size).generateWeightMatrix()
+        self.inputWeight = topology.ClassicInputTopology(self.inputD, self.size, dtype=self.dtype).generateWeightMatrix()
 
         # Other reservoir parameters are also kept constant
         self.spectralRadius = spectralRadius
@@ -144,160 +318,99 @@ class RandomConnectivityTuner:
 
         # To get rid off the randomness in assigning weights, run it 10 times and  take the average error
         times = 10
-        cumulativeError = 0
-
-        for i in range(times):
-            # Input and weight connectivity Matrix
-            inputWeightMatrix = topology.ClassicInputTopology(self.inputD, self.size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.RandomReservoirTopology(size=self.size, connectivity=reservoirConnectivity).generateWeightMatrix()
-
-            #Create the reservoir
-            res = classicESN.Reservoir(size=self.size,
-                                      spectralRadius=self.spectralRadius,
-                                      inputScaling=self.inputScaling,
-                                      reservoirScaling=self.reservoirScaling,
-                                      leakingRate=self.leakingRate,
-                                      initialTransient=self.initialTransient,
-                                      inputData=self.trainingInputData,
-                                      outputData=self.trainingOutputData,
-                                      inputWeightRandom=inputWeightMatrix,
-                                      reservoirWeightRandom=reservoirWeightMatrix)
-
-            #Train the reservoir
-            res.trainReservoir()
-
-            # Warm up
-            predictedTrainingOutputData = res.predict(self.trainingInputData[-self.initialTransient:])
-
-            #Predict for the validation data
-            predictedOutputData = util.predictFuture(res, self.initialSeed, self.horizon)
 
-            gc.collect()
-
-            #Calcuate the regression error
-            errorFunction = metrics.MeanSquareError()
-            error = errorFunction.compute(self.validationOutputData, predictedOutputData)
-            cumulativeError += error
-
-        regressionError = cumulativeError/times
+        # All the repetitions are trained as ensembles of reservoirs
+        regressionError = util.averageEnsembleError(times,
+                                                    lambda: (topology.ClassicInputTopology(self.inputD, self.size, dtype=self.dtype).generateWeightMatrix(),
+                                                             topology.RandomReservoirTopology(size=self.size, connectivity=reservoirConnectivity, dtype=self.dtype).generateWeightMatrix()),
+                                                    size=self.size, spectralRadius=self.spectralRadius,
+                                                    inputScaling=self.inputScaling, reservoirScaling=self.reservoirScaling,
+                                                    leakingRate=self.leakingRate, initialTransient=self.initialTransient,
+                                                    trainingInputData=self.trainingInputData,
+                                                    trainingOutputData=self.trainingOutputData,
+                                                    warmupInputData=self.trainingInputData[-self.initialTransient:],
+                                                    seed=self.initialSeed, horizon=self.horizon,
+                                                    actualOutputData=self.validationOutputData, dtype=self.dtype,
+                                                    ensembleSize=self.ensembleSize)
 
         #Return the error
         print("\nThe Parameters: "+str(x)+" Regression error:"+str(regressionError))
         return regressionError
 
     def __tune__(self):
+        journal = None if self.journal is None else Journal(self.journal)
+        objective = self.__reservoirTrain__ if journal is None else journal.wrap(self.__reservoirTrain__)
         if self.minimizer == Minimizer.DifferentialEvolution:
             bounds = [self.reservoirConnectivityBound]
-            result = optimize.differential_evolution(self.__reservoirTrain__,bounds=bounds)
+            result = optimize.differential_evolution(objective,bounds=bounds)
             print("The Optimization results are :"+str(result))
             return result.x[0], self.inputWeight
         elif self.minimizer == Minimizer.BasinHopping:
             bounds = [self.reservoirConnectivityBound]
             minimizer_kwargs = {"method": "TNC", "bounds":bounds, "options": {"eps":0.01}}
             mytakestep = ParameterStep()
-            result = optimize.basinhopping(self.__reservoirTrain__, x0=self.initialGuess, minimizer_kwargs=minimizer_kwargs, take_step=mytakestep, stepsize=0.01)
+            result = optimize.basinhopping(objective, x0=self.initialGuess, minimizer_kwargs=minimizer_kwargs, take_step=mytakestep, stepsize=0.01)
             print("The Optimization results are :"+str(result))
             return result.x[0]
     def getOptimalParameters(self):
         return self.__tune__()
 
-class RandomConnectivityBruteTuner:
-    def __init__(self, size, initialTransient, trainingInputData, trainingOutputData,
-                 initialSeed, validationOutputData,
-                 spectralRadius = 0.79, inputScaling = 0.5, reservoirScaling=0.5, leakingRate=0.3):
-        self.size = size
-        self.initialTransient = initialTransient
-        self.trainingInputData = trainingInputData
-        self.trainingOutputData = trainingOutputData
-        self.initialSeed = initialSeed
-        self.validationOutputData = validationOutputData
-        self.horizon = self.validationOutputData.shape[0]
-        self.ranges = slice(0.01,1.01,0.01)
-
-        # Input-to-reservoir is of Classic Type - Fully connected and maintained as constant
-        self.inputN, self.inputD = self.trainingInputData.shape
-
-        # Other reservoir parameters are also kept constant
-        self.spectralRadius = spectralRadius
-        self.inputScaling = inputScaling
-        self.reservoirScaling = reservoirScaling
-        self.leakingRate = leakingRate
-
-    def generateRandomInputWeightMatrix(self):
-        return np.random.rand(self.size, self.inputD)
-
-    def generateRandomReservoirWeightMatrix(self):
-        return np.random.rand(self.size, self.size)
-
-    def __reservoirTrain__(self, x):
-
-        #Extract the parameters
-        reservoirConnectivity = float(x)
-
-        # To get rid off the randomness in assigning weights, run it 10 times and  take the average error
-        times = 10
-        cumulativeError = 0
-
-        for i in range(times):
-            # Input and weight connectivity Matrix
-            inputWeightMatrix = topology.ClassicInputTopology(self.inputD, self.size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.RandomReservoirTopology(size=self.size, connectivity=reservoirConnectivity).generateWeightMatrix()
-
-            #Create the reservoir
-            res = classicESN.Reservoir(size=self.size,
-                                      spectralRadius=self.spectralRadius,
-                                      inputScaling=self.inputScaling,
-                                      reservoirScaling=self.reservoirScaling,
-                                      leakingRate=self.leakingRate,
-                                      initialTransient=self.initialTransient,
-                                      inputData=self.trainingInputData,
-                                      outputData=self.trainingOutputData,
-                                      inputWeightRandom=inputWeightMatrix,
-                                      reservoirWeightRandom=reservoirWeightMatrix)
-
-            #Train the reservoir
-            res.trainReservoir()
-
-            # Warm up
-            predictedTrainingOutputData = res.predict(self.trainingInputData[-self.initialTransient:])
-
-            #Predict for the validation data
-            predictedOutputData = util.predictFuture(res, self.initialSeed, self.horizon)
-
-            gc.collect()
-
-            #Calcuate the regression error
-            errorFunction = metrics.MeanSquareError()
-            error = errorFunction.compute(self.validationOutputData, predictedOutputData)
-            cumulativeError += error
-
-        regressionError = cumulativeError/times
-
-        #Return the error
-        print("\nThe Parameters: "+str(x)+" Regression error:"+str(regressionError))
-        return regressionError
+class ConnectivityBruteTuner(parallel.SharesArrays):
+    """
+    Base of the connectivity brute tuners - a grid of topology parameters, each grid point evaluated as the average
+    error of several reservoirs (repetitions) drawn from the topology. The subclasses give the grid (__ranges__) and
+    the reservoir weight matrix of a repetition (__reservoirWeightMatrix__).
+    """
 
-    def __tune__(self):
-        result = optimize.brute(self.__reservoirTrain__,ranges=(self.ranges,), finish=None, full_output=True)
-        #print("The Optimization results are :"+str(result))
-        return result[0]
-    def getOptimalParameters(self):
-        return self.__tune__()
+    # Number of reservoirs averaged per grid point
+    repetitions = 100
 
-class ErdosRenyiConnectivityBruteTuner:
     def __init__(self, size, initialTransient, trainingInputData, trainingOutputData,
                  initialSeed, validationOutputData,
-                 spectralRadius = 0.79, inputScaling = 0.5, reservoirScaling=0.5, leakingRate=0.3):
+                 spectralRadius = 0.79, inputScaling = 0.5, reservoirScaling=0.5, leakingRate=0.3,
+                 dtype=np.float64, workers=1, seed=None, minimizer=Minimizer.BruteForce, evaluations=60,
+                 journal=None, fidelity=1.0, shortlist=9,
+                 trace=None, traceMemory=False, ensembleSize=10):
+        """
+        :param workers: number of processes - every (grid point, chunk of repetitions) pair is a separate task
+        :param seed: base seed of the tasks - with a seed, the result is the same for any number of workers
+        :param minimizer: Minimizer.BruteForce evaluates every grid point with all the repetitions,
+                          Minimizer.SuccessiveHalving drops the worst grid points on a smaller budget first,
+                          Minimizer.Bayesian evaluates only the grid points a Gaussian process surrogate picks
+        :param evaluations: number of grid points evaluated by the Bayesian optimisation
+        :param journal: file name of the evaluation journal - a restarted tuner with the same journal replays the
+                        recorded (grid point, chunk of repetitions) tasks and continues where it stopped
+        :param fidelity: fidelity of the brute force search - below 1 the grid is evaluated on the most recent part
+                         of the training data and a shorter validation horizon (see fidelityBudget), and only the
+                         shortlist best grid points are evaluated, with rising fidelity, on all the data
+        :param trace: file name of the evaluation trace - the phase timings and the peak resident memory of the
+                      process at every evaluation are appended to it as JSON lines (see Trace.printSummary)
+        :param traceMemory: also trace the peak memory allocated by every evaluation with tracemalloc - exact, but it
+                            slows down the evaluations (and so distorts the phase timings)
+        :param ensembleSize: number of reservoirs trained together (see util.averageEnsembleError) - lower it for
+                             large reservoirs, a batch holds several ensembleSize X size X size arrays
+        """
         self.size = size
+        self.dtype = dtype
         self.initialTransient = initialTransient
         self.trainingInputData = trainingInputData
         self.trainingOutputData = trainingOutputData
         self.initialSeed = initialSeed
         self.validationOutputData = validationOutputData
         self.horizon = self.validationOutputData.shape[0]
+        self.workers = workers
+        self.seed = seed
+        self.minimizer = minimizer
+        self.evaluations = evaluations
+        self.journal = journal
+        self.fidelity = fidelity
+        self.shortlist = shortlist
+        self.trace = trace
+        self.traceMemory = traceMemory
+        self.ensembleSize = ensembleSize
 
-        # Probability ranges
-        self.ranges = slice(0.01,1.01,0.01)
+        # Tuple of slices, as in optimize.brute
+        self.ranges = self.__ranges__()
 
         # Input-to-reservoir is of Classic Type - Fully connected and maintained as constant
         self.inputN, self.inputD = self.trainingInputData.shape
@@ -308,247 +421,149 @@ class ErdosRenyiConnectivityBruteTuner:
         self.reservoirScaling = reservoirScaling
         self.leakingRate = leakingRate
 
-        # Dictionary to store the reservoir conn
-        self.reservoirConnDict = {}
+    def __ranges__(self):
+        raise NotImplementedError
 
+    def __reservoirWeightMatrix__(self, x, repetition):
+        """
+        :param x: the grid point
+        :param repetition: number of the repetition at the grid point (0, 1, ...)
+        :return: a random reservoir weight matrix of the topology
+        """
+        raise NotImplementedError
+
+    def __optimum__(self, x):
+        # The optimal grid point as returned by getOptimalParameters
+        return x
 
     def generateRandomInputWeightMatrix(self):
-        return np.random.rand(self.size, self.inputD)
+        return np.random.rand(self.size, self.inputD).astype(self.dtype)
 
     def generateRandomReservoirWeightMatrix(self):
-        return np.random.rand(self.size, self.size)
-
-    def __reservoirTrain__(self, x):
-
-        #Extract the parameters
-        probability = x
-
-        # To get rid off the randomness in assigning weights, run it 10 times and  take the average error
-        times = 100
-        cumulativeError = 0
-
-        for i in range(times):
-            # Input and weight connectivity Matrix
-            inputWeightMatrix = topology.ClassicInputTopology(self.inputD, self.size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.ErdosRenyiTopology(size=self.size, probability=probability).generateWeightMatrix()
-
-            #Create the reservoir
-            res = classicESN.Reservoir(size=self.size,
-                                      spectralRadius=self.spectralRadius,
-                                      inputScaling=self.inputScaling,
-                                      reservoirScaling=self.reservoirScaling,
-                                      leakingRate=self.leakingRate,
-                                      initialTransient=self.initialTransient,
-                                      inputData=self.trainingInputData,
-                                      outputData=self.trainingOutputData,
-                                      inputWeightRandom=inputWeightMatrix,
-                                      reservoirWeightRandom=reservoirWeightMatrix)
-
-            #Train the reservoir
-            res.trainReservoir()
-
-            # Warm up
-            predictedTrainingOutputData = res.predict(self.trainingInputData[-self.initialTransient:])
-
-            #Predict for the validation data
-            predictedOutputData = util.predictFuture(res, self.initialSeed, self.horizon)
-
-            gc.collect()
-
-            #Calcuate the regression error
-            errorFunction = metrics.MeanSquareError()
-            error = errorFunction.compute(self.validationOutputData, predictedOutputData)
-            cumulativeError += error
-
-        regressionError = cumulativeError/times
+        return np.random.rand(self.size, self.size).astype(self.dtype)
+
+    @trace.traced
+    def __reservoirTrain__(self, x, times=None, fidelity=1.0):
+        times = self.repetitions if times is None else times
+
+        # Train on the most recent part of the training data and validate on the first steps of the validation data
+        trainingLength, horizon = fidelityBudget(fidelity, self.inputN, self.horizon, self.initialTransient + self.size)
+
+        # To get rid off the randomness in assigning weights, run it several times and take the average error
+        # All the repetitions are trained as ensembles of reservoirs - numbered across the chunks of the grid point
+        repetitions = itertools.count(parallel.firstTrial())
+        regressionError = util.averageEnsembleError(times,
+                                                    lambda: (topology.ClassicInputTopology(self.inputD, self.size, dtype=self.dtype).generateWeightMatrix(),
+                                                             self.__reservoirWeightMatrix__(x, next(repetitions))),
+                                                    size=self.size, spectralRadius=self.spectralRadius,
+                                                    inputScaling=self.inputScaling, reservoirScaling=self.reservoirScaling,
+                                                    leakingRate=self.leakingRate, initialTransient=self.initialTransient,
+                                                    trainingInputData=self.trainingInputData[-trainingLength:],
+                                                    trainingOutputData=self.trainingOutputData[-trainingLength:],
+                                                    warmupInputData=self.trainingInputData[-self.initialTransient:],
+                                                    seed=self.initialSeed, horizon=horizon,
+                                                    actualOutputData=self.validationOutputData[:horizon], dtype=self.dtype,
+                                                    ensembleSize=self.ensembleSize)
 
         #Return the error
-        print("\nThe Parameters: "+str(x)+" Regression error:"+str(regressionError))
         return regressionError
 
+    def __report__(self, x, regressionError):
+        print("\nThe Parameters: "+str(x)+" Regression error:"+str(regressionError))
+
     def __tune__(self):
-        result = optimize.brute(self.__reservoirTrain__,ranges=(self.ranges,), finish=None, full_output=True)
-        #print("The Optimization results are :"+str(result))
-        return result[0]
+        journal = None if self.journal is None else Journal(self.journal)
+
+        # The data is placed in shared memory for the workers
+        if self.workers > 1:
+            self.shareArrays()
+        try:
+            if self.minimizer == Minimizer.SuccessiveHalving:
+                grid, points = parallel.gridPoints(self.ranges)
+                result = parallel.successiveHalving(self.__reservoirTrain__, points, repetitions=self.repetitions,
+                                                    workers=self.workers, seed=self.seed, callback=self.__report__,
+                                                    journal=journal)
+            elif self.minimizer == Minimizer.Bayesian:
+                result = bayes.minimizeGrid(self.__reservoirTrain__, self.ranges, repetitions=self.repetitions,
+                                            evaluations=self.evaluations, workers=self.workers, seed=self.seed,
+                                            callback=self.__report__, journal=journal)
+            else:
+                result = parallel.bruteGrid(self.__reservoirTrain__, ranges=self.ranges, repetitions=self.repetitions,
+                                            workers=self.workers, seed=self.seed, callback=self.__report__,
+                                            journal=journal, arguments=(self.fidelity,))
+                if self.fidelity < 1.0:
+                    grid, points = parallel.gridPoints(self.ranges)
+                    result = refineShortlist(self.__reservoirTrain__, points, result[3].ravel(), self.shortlist,
+                                             self.repetitions, self.fidelity, workers=self.workers, seed=self.seed,
+                                             callback=self.__report__, journal=journal)
+        finally:
+            self.releaseArrays()
+        return self.__optimum__(result[0])
+
     def getOptimalParameters(self):
         return self.__tune__()
 
-class ScaleFreeNetworksConnectivityBruteTuner:
-    def __init__(self, size, initialTransient, trainingInputData, trainingOutputData,
-                 initialSeed, validationOutputData,
-                 spectralRadius = 0.79, inputScaling = 0.5, reservoirScaling=0.5, leakingRate=0.3):
-        self.size = size
-        self.initialTransient = initialTransient
-        self.trainingInputData = trainingInputData
-        self.trainingOutputData = trainingOutputData
-        self.initialSeed = initialSeed
-        self.validationOutputData = validationOutputData
-        self.horizon = self.validationOutputData.shape[0]
-
-        # Attachment range
-        self.ranges = slice(1,self.size - 1,1)
-
-        # Input-to-reservoir is of Classic Type - Fully connected and maintained as constant
-        self.inputN, self.inputD = self.trainingInputData.shape
 
-        # Other reservoir parameters are also kept constant
-        self.spectralRadius = spectralRadius
-        self.inputScaling = inputScaling
-        self.reservoirScaling = reservoirScaling
-        self.leakingRate = leakingRate
+class PooledConnectivityBruteTuner(ConnectivityBruteTuner):
+    """
+    Connectivity brute tuner whose reservoir topologies are read from a TopologyPool
+    """
+    def __init__(self, size, initialTransient, trainingInputData, trainingOutputData,
+                 initialSeed, validationOutputData, *arguments, topologyPool=None, **keywords):
+        """
+        :param topologyPool: TopologyPool the connectivity masks of the repetitions are read from (repetition i of a
+                             grid point is mask i) - by default a pool of this tuner (same seed), shared with the
+                             workers through its mask files
+        :param arguments, keywords: the other parameters, as ConnectivityBruteTuner
+        """
+        ConnectivityBruteTuner.__init__(self, size, initialTransient, trainingInputData, trainingOutputData,
+                                        initialSeed, validationOutputData, *arguments, **keywords)
+        self.topologyPool = TopologyPool(self.size, seed=self.seed) if topologyPool is None else topologyPool
 
         # Dictionary to store the reservoir conn
         self.reservoirConnDict = {}
 
 
-    def generateRandomInputWeightMatrix(self):
-        return np.random.rand(self.size, self.inputD)
-
-    def generateRandomReservoirWeightMatrix(self):
-        return np.random.rand(self.size, self.size)
+class RandomConnectivityBruteTuner(ConnectivityBruteTuner):
+    repetitions = 10
 
-    def __reservoirTrain__(self, x):
+    def __ranges__(self):
+        # Connectivity ranges
+        return (slice(0.01,1.01,0.01),)
 
-        #Extract the parameters
-        attachment = int(x)
+    def __reservoirWeightMatrix__(self, x, repetition):
+        reservoirConnectivity = float(x[0])
+        return topology.RandomReservoirTopology(size=self.size, connectivity=reservoirConnectivity, dtype=self.dtype).generateWeightMatrix()
 
-        # To get rid off the randomness in assigning weights, run it 10 times and  take the average error
-        times = 100
-        cumulativeError = 0
-
-        for i in range(times):
-            # Input and weight connectivity Matrix
-            inputWeightMatrix = topology.ClassicInputTopology(self.inputD, self.size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.ScaleFreeNetworks(size=self.size, attachmentCount=attachment).generateWeightMatrix()
-
-            #Create the reservoir
-            res = classicESN.Reservoir(size=self.size,
-                                      spectralRadius=self.spectralRadius,
-                                      inputScaling=self.inputScaling,
-                                      reservoirScaling=self.reservoirScaling,
-                                      leakingRate=self.leakingRate,
-                                      initialTransient=self.initialTransient,
-                                      inputData=self.trainingInputData,
-                                      outputData=self.trainingOutputData,
-                                      inputWeightRandom=inputWeightMatrix,
-                                      reservoirWeightRandom=reservoirWeightMatrix)
-
-            #Train the reservoir
-            res.trainReservoir()
-
-            # Warm up
-            predictedTrainingOutputData = res.predict(self.trainingInputData[-self.initialTransient:])
 
-            #Predict for the validation data
-            predictedOutputData = util.predictFuture(res, self.initialSeed, self.horizon)
+class ErdosRenyiConnectivityBruteTuner(PooledConnectivityBruteTuner):
+    def __ranges__(self):
+        # Probability ranges
+        return (slice(0.01,1.01,0.01),)
 
-            gc.collect()
+    def __reservoirWeightMatrix__(self, x, repetition):
+        probability = float(x[0])
+        return self.topologyPool.generateWeightMatrix(Topology.ErdosRenyi, probability, repetition=repetition, dtype=self.dtype)
 
-            #Calcuate the regression error
-            errorFunction = metrics.MeanSquareError()
-            error = errorFunction.compute(self.validationOutputData, predictedOutputData)
-            cumulativeError += error
 
-        regressionError = cumulativeError/times
+class ScaleFreeNetworksConnectivityBruteTuner(PooledConnectivityBruteTuner):
+    def __ranges__(self):
+        # Attachment range
+        return (slice(1,self.size - 1,1),)
 
-        #Return the error
-        print("\nThe Parameters: "+str(x)+" Regression error:"+str(regressionError))
-        return regressionError
+    def __reservoirWeightMatrix__(self, x, repetition):
+        attachment = int(x[0])
+        return self.topologyPool.generateWeightMatrix(Topology.ScaleFree, attachment, repetition=repetition, dtype=self.dtype)
 
-    def __tune__(self):
-        result = optimize.brute(self.__reservoirTrain__,ranges=(self.ranges,), finish=None, full_output=True)
-        #print("The Optimization results are :"+str(result))
-        return int(result[0])
-    def getOptimalParameters(self):
-        return self.__tune__()
+    def __optimum__(self, x):
+        return int(x)
 
-class SmallWorldGraphsConnectivityBruteTuner:
-    def __init__(self, size, initialTransient, trainingInputData, trainingOutputData,
-                 initialSeed, validationOutputData,
-                 spectralRadius = 0.79, inputScaling = 0.5, reservoirScaling=0.5, leakingRate=0.3):
-        self.size = size
-        self.initialTransient = initialTransient
-        self.trainingInputData = trainingInputData
-        self.trainingOutputData = trainingOutputData
-        self.initialSeed = initialSeed
-        self.validationOutputData = validationOutputData
-        self.horizon = self.validationOutputData.shape[0]
 
+class SmallWorldGraphsConnectivityBruteTuner(PooledConnectivityBruteTuner):
+    def __ranges__(self):
         # Ranges for mean degree k and beta
-        self.ranges = (slice(2,self.size - 1,2), slice(0.11,1.01,0.05))
-
-        # Input-to-reservoir is of Classic Type - Fully connected and maintained as constant
-        self.inputN, self.inputD = self.trainingInputData.shape
-
-        # Other reservoir parameters are also kept constant
-        self.spectralRadius = spectralRadius
-        self.inputScaling = inputScaling
-        self.reservoirScaling = reservoirScaling
-        self.leakingRate = leakingRate
-
-        # Dictionary to store the reservoir conn
-        self.reservoirConnDict = {}
-
-
-    def generateRandomInputWeightMatrix(self):
-        return np.random.rand(self.size, self.inputD)
-
-    def generateRandomReservoirWeightMatrix(self):
-        return np.random.rand(self.size, self.size)
+        return (slice(2,self.size - 1,2), slice(0.11,1.01,0.05))
 
-    def __reservoirTrain__(self, x):
-
-        #Extract the parameters
+    def __reservoirWeightMatrix__(self, x, repetition):
         meanDegree, beta = x
-        meanDegree = int(meanDegree)
-
-        # To get rid off the randomness in assigning weights, run it 10 times and  take the average error
-        times = 100
-        cumulativeError = 0
-
-        for i in range(times):
-            # Input and weight connectivity Matrix
-            inputWeightMatrix = topology.ClassicInputTopology(self.inputD, self.size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.SmallWorldGraphs(size=self.size, meanDegree=meanDegree, beta=beta).generateWeightMatrix()
-
-            #Create the reservoir
-            res = classicESN.Reservoir(size=self.size,
-                                      spectralRadius=self.spectralRadius,
-                                      inputScaling=self.inputScaling,
-                                      reservoirScaling=self.reservoirScaling,
-                                      leakingRate=self.leakingRate,
-                                      initialTransient=self.initialTransient,
-                                      inputData=self.trainingInputData,
-                                      outputData=self.trainingOutputData,
-                                      inputWeightRandom=inputWeightMatrix,
-                                      reservoirWeightRandom=reservoirWeightMatrix)
-
-            #Train the reservoir
-            res.trainReservoir()
-
-            # Warm up
-            predictedTrainingOutputData = res.predict(self.trainingInputData[-self.initialTransient:])
-
-            #Predict for the validation data
-            predictedOutputData = util.predictFuture(res, self.initialSeed, self.horizon)
-
-            gc.collect()
-
-            #Calcuate the regression error
-            errorFunction = metrics.MeanSquareError()
-            error = errorFunction.compute(self.validationOutputData, predictedOutputData)
-            cumulativeError += error
-
-        regressionError = cumulativeError/times
-
-        #Return the error
-        print("\nThe Parameters: "+str(x)+" Regression error:"+str(regressionError))
-        return regressionError
-
-    def __tune__(self):
-        result = optimize.brute(self.__reservoirTrain__,ranges=self.ranges, finish=None, full_output=True)
-        #print("The Optimization results are :"+str(result))
-        return result[0]
-    def getOptimalParameters(self):
-        return self.__tune__()
-
+        return self.topologyPool.generateWeightMatrix(Topology.SmallWorld, int(meanDegree), beta, repetition=repetition, dtype=self.dtype)
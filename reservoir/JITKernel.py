@@ -0,0 +1,207 @@
+import numpy as np
+import scipy.sparse as sparse
+from reservoir import ActivationFunctions as act
+
+# Numba compiled versions of the reservoir recurrence. Numba is optional - when it is not installed, 'available' is
+# False and the reservoirs fall back to the NumPy kernel.
+try:
+    import numba
+except ImportError:
+    numba = None
+
+available = numba is not None
+
+# Activation codes understood by the compiled loops
+_TANH = 0
+_LOGISTIC = 1
+_RELU = 2
+_LINEAR = 3
+
+
+def activationCode(activation):
+    """
+    :return: (code, beta) for the activation functions the compiled loops support, otherwise None
+    """
+    if isinstance(activation, act.HyperbolicTangent):
+        return _TANH, 1.0
+    elif isinstance(activation, act.LogisticFunction):
+        return _LOGISTIC, float(activation.beta)
+    elif isinstance(activation, act.ReLU):
+        return _RELU, 1.0
+    elif isinstance(activation, act.Linear):
+        return _LINEAR, 1.0
+    return None
+
+
+def supports(*activations):
+    return available and all(activationCode(activation) is not None for activation in activations)
+
+
+if available:
+
+    @numba.njit(cache=True)
+    def _activate(x, code, beta):
+        if code == _TANH:
+            return np.tanh(x)
+        elif code == _LOGISTIC:
+            return 1.0 / (1.0 + np.exp(-beta * x))
+        elif code == _RELU:
+            return x if x > 0.0 else 0.0
+        return x
+
+    @numba.njit(cache=True)
+    def _leakyUpdate(u, inputWeight, leakingRate, code, beta, state, recurrent):
+        # recurrent holds W x(t-1) - the input projection, activation and leaky blend are fused in one pass
+        for i in range(state.shape[0]):
+            total = recurrent[i]
+            for d in range(u.shape[0]):
+                total += inputWeight[i, d] * u[d]
+            state[i] = (1.0 - leakingRate) * state[i] + leakingRate * _activate(total, code, beta)
+
+    @numba.njit(cache=True)
+    def _sparseDot(data, indices, indptr, state, recurrent):
+        for i in range(state.shape[0]):
+            total = 0.0
+            for k in range(indptr[i], indptr[i + 1]):
+                total += data[k] * state[indices[k]]
+            recurrent[i] = total
+
+    @numba.njit(cache=True)
+    def _harvestDense(inputData, inputWeight, weight, leakingRate, code, beta, state, states, storeStates):
+        recurrent = np.empty_like(state)
+        for t in range(inputData.shape[0]):
+            np.dot(weight, state, recurrent)
+            _leakyUpdate(inputData[t], inputWeight, leakingRate, code, beta, state, recurrent)
+            if storeStates:
+                states[t, :] = state
+
+    @numba.njit(cache=True)
+    def _harvestSparse(inputData, inputWeight, data, indices, indptr, leakingRate, code, beta, state, states,
+                       storeStates):
+        recurrent = np.empty_like(state)
+        for t in range(inputData.shape[0]):
+            _sparseDot(data, indices, indptr, state, recurrent)
+            _leakyUpdate(inputData[t], inputWeight, leakingRate, code, beta, state, recurrent)
+            if storeStates:
+                states[t, :] = state
+
+    @numba.njit(cache=True)
+    def _readout(outputWeight, outputCode, outputBeta, state):
+        output = np.dot(outputWeight, state)
+        for o in range(output.shape[0]):
+            output[o] = _activate(output[o], outputCode, outputBeta)
+        return output
+
+    @numba.njit(cache=True)
+    def _predictOnePointDense(u, inputWeight, weight, outputWeight, leakingRate, code, beta, outputCode, outputBeta,
+                              state):
+        _leakyUpdate(u, inputWeight, leakingRate, code, beta, state, np.dot(weight, state))
+        return _readout(outputWeight, outputCode, outputBeta, state)
+
+    @numba.njit(cache=True)
+    def _predictOnePointSparse(u, inputWeight, data, indices, indptr, outputWeight, leakingRate, code, beta,
+                               outputCode, outputBeta, state):
+        recurrent = np.empty_like(state)
+        _sparseDot(data, indices, indptr, state, recurrent)
+        _leakyUpdate(u, inputWeight, leakingRate, code, beta, state, recurrent)
+        return _readout(outputWeight, outputCode, outputBeta, state)
+
+    @numba.njit(cache=True)
+    def _feedBack(query, inputColumns, outputColumns, lags, trajectory, row):
+        for k in range(inputColumns.shape[0]):
+            source = row + 1 - lags[k]
+            if source >= 0:
+                query[inputColumns[k]] = trajectory[source, outputColumns[k]]
+
+    @numba.njit(cache=True)
+    def _generateDense(query, inputWeight, weight, outputWeight, leakingRate, code, beta, outputCode, outputBeta,
+                       state, inputColumns, outputColumns, lags, trajectory, historyLength):
+        recurrent = np.empty_like(state)
+        for t in range(trajectory.shape[0] - historyLength):
+            np.dot(weight, state, recurrent)
+            _leakyUpdate(query, inputWeight, leakingRate, code, beta, state, recurrent)
+            trajectory[historyLength + t, :] = _readout(outputWeight, outputCode, outputBeta, state)
+            _feedBack(query, inputColumns, outputColumns, lags, trajectory, historyLength + t)
+
+    @numba.njit(cache=True)
+    def _generateSparse(query, inputWeight, data, indices, indptr, outputWeight, leakingRate, code, beta, outputCode,
+                        outputBeta, state, inputColumns, outputColumns, lags, trajectory, historyLength):
+        recurrent = np.empty_like(state)
+        for t in range(trajectory.shape[0] - historyLength):
+            _sparseDot(data, indices, indptr, state, recurrent)
+            _leakyUpdate(query, inputWeight, leakingRate, code, beta, state, recurrent)
+            trajectory[historyLength + t, :] = _readout(outputWeight, outputCode, outputBeta, state)
+            _feedBack(query, inputColumns, outputColumns, lags, trajectory, historyLength + t)
+
+
+def harvestStates(inputData, inputWeight, reservoirWeight, leakingRate, activation, initialState, states=None):
+    """
+    Same as Kernel.harvestStates, but the whole loop is compiled - the input projection, activation and leaky blend
+    are fused into one pass over the state after the recurrent mat-vec
+    """
+    dtype = reservoirWeight.dtype
+    internalState = np.array(initialState, dtype=dtype)
+    code, beta = activationCode(activation)
+    inputData = np.ascontiguousarray(inputData, dtype=dtype)
+    inputWeight = np.ascontiguousarray(inputWeight, dtype=dtype)
+    storeStates = states is not None
+    if not storeStates:
+        states = np.zeros((1, 1), dtype=dtype)
+
+    if sparse.issparse(reservoirWeight):
+        csr = sparse.csr_matrix(reservoirWeight)
+        _harvestSparse(inputData, inputWeight, csr.data, csr.indices, csr.indptr, leakingRate, code, beta,
+                       internalState, states, storeStates)
+    else:
+        _harvestDense(inputData, inputWeight, np.ascontiguousarray(reservoirWeight), leakingRate, code, beta,
+                      internalState, states, storeStates)
+    return internalState
+
+
+def predictOnePoint(inputVector, inputWeight, reservoirWeight, outputWeight, leakingRate, activation,
+                    outputActivation, initialState):
+    """
+    One reservoir step followed by the readout, in a single compiled call
+    :return: output (Ny), state after the step
+    """
+    dtype = reservoirWeight.dtype
+    internalState = np.array(initialState, dtype=dtype)
+    code, beta = activationCode(activation)
+    outputCode, outputBeta = activationCode(outputActivation)
+    inputVector = np.ascontiguousarray(inputVector, dtype=dtype)
+    inputWeight = np.ascontiguousarray(inputWeight, dtype=dtype)
+    outputWeight = np.ascontiguousarray(outputWeight, dtype=dtype)
+
+    if sparse.issparse(reservoirWeight):
+        csr = sparse.csr_matrix(reservoirWeight)
+        output = _predictOnePointSparse(inputVector, inputWeight, csr.data, csr.indices, csr.indptr, outputWeight,
+                                        leakingRate, code, beta, outputCode, outputBeta, internalState)
+    else:
+        output = _predictOnePointDense(inputVector, inputWeight, np.ascontiguousarray(reservoirWeight), outputWeight,
+                                       leakingRate, code, beta, outputCode, outputBeta, internalState)
+    return output, internalState
+
+
+def generate(inputVector, inputWeight, reservoirWeight, outputWeight, leakingRate, activation, outputActivation,
+             initialState, inputColumns, outputColumns, lags, trajectory, historyLength):
+    """
+    Same as Kernel.generate - the whole closed loop rollout runs compiled
+    """
+    dtype = reservoirWeight.dtype
+    internalState = np.array(initialState, dtype=dtype)
+    query = np.array(inputVector, dtype=dtype)
+    code, beta = activationCode(activation)
+    outputCode, outputBeta = activationCode(outputActivation)
+    inputWeight = np.ascontiguousarray(inputWeight, dtype=dtype)
+    outputWeight = np.ascontiguousarray(outputWeight, dtype=dtype)
+    feedback = (np.asarray(inputColumns, dtype=np.int64), np.asarray(outputColumns, dtype=np.int64),
+                np.asarray(lags, dtype=np.int64), trajectory, historyLength)
+
+    if sparse.issparse(reservoirWeight):
+        csr = sparse.csr_matrix(reservoirWeight)
+        _generateSparse(query, inputWeight, csr.data, csr.indices, csr.indptr, outputWeight, leakingRate, code, beta,
+                        outputCode, outputBeta, internalState, *feedback)
+    else:
+        _generateDense(query, inputWeight, np.ascontiguousarray(reservoirWeight), outputWeight, leakingRate, code,
+                       beta, outputCode, outputBeta, internalState, *feedback)
+    return internalState
@@ -0,0 +1,106 @@
+import numpy as np
+import json
+import os
+import time
+
+# On-disk journal of the objective evaluations of a tuner - one JSON object per line, appended (and flushed) as soon
+# as an evaluation finishes. A restarted tuner with the same journal replays the recorded evaluations instead of
+# training the reservoirs again, so with the same seed it runs through the finished part of the search (the earlier
+# DE populations or grid points) in no time and continues where it stopped.
+
+
+class Journal(object):
+    def __init__(self, fileName):
+        """
+        :param fileName: the journal file - created if it does not exist, replayed if it does
+        """
+        self.fileName = fileName
+        self.entries = {}
+        self.seed = None
+        self.truncated = False
+        if os.path.exists(fileName):
+            with open(fileName) as journalFile:
+                for line in journalFile:
+                    self.truncated = not line.endswith("\n")
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line may be cut short by a crash
+                        continue
+                    if "error" in entry:
+                        self.entries[self.key(entry["x"], *entry.get("arguments", []))] = entry
+                    elif "seed" in entry:
+                        self.seed = entry["seed"]
+
+    @staticmethod
+    def key(x, *arguments):
+        # Exact float values - the json representation of a float round trips
+        return tuple(float(value) for value in np.ravel(x)) + tuple(arguments)
+
+    def __append(self, entry):
+        with open(self.fileName, "a") as journalFile:
+            # Start a new line after a line cut short by a crash
+            if self.truncated:
+                journalFile.write("\n")
+                self.truncated = False
+            journalFile.write(json.dumps(entry) + "\n")
+            journalFile.flush()
+            os.fsync(journalFile.fileno())
+
+    def sessionSeed(self, seed=None):
+        """
+        The seed of the search - the recorded one when the journal is replayed, otherwise the given one (or a random
+        one), which is then recorded. Resuming needs the same seed, so that the search visits the same points.
+        """
+        if self.seed is None:
+            self.seed = int(np.random.randint(2**31 - 1)) if seed is None else int(seed)
+            self.__append({"seed": self.seed})
+        return self.seed
+
+    def lookup(self, x, *arguments):
+        """
+        :return: the recorded error at x (with the arguments, eg. number of trials and their seed), or None
+        """
+        entry = self.entries.get(self.key(x, *arguments))
+        return None if entry is None else entry["error"]
+
+    def record(self, x, error, wallTime, *arguments):
+        entry = {"x": [float(value) for value in np.ravel(x)], "error": float(error), "wallTime": wallTime,
+                 "seed": self.seed}
+        if arguments:
+            entry["arguments"] = [value.item() if isinstance(value, np.generic) else value for value in arguments]
+        self.entries[self.key(x, *arguments)] = entry
+        self.__append(entry)
+
+    def wrap(self, objective):
+        """
+        :return: objective(x) which is only evaluated for the points not in the journal
+        """
+        def journaled(x):
+            error = self.lookup(x)
+            if error is None:
+                start = time.time()
+                error = objective(x)
+                self.record(x, error, time.time() - start)
+            return error
+        return journaled
+
+    def map(self, timedMap, points, *arguments):
+        """
+        Journaled version of a parallel map
+        :param timedMap: timedMap(points) - list of (error, wall time) for the points
+        :param arguments: the settings the errors depend on besides the point (eg. the fidelity) - recorded with
+                          every entry, so entries of another setting are not replayed
+        :return: the errors of all the points
+        """
+        points = list(points)
+        errors = [self.lookup(x, *arguments) for x in points]
+        missing = [i for i in range(len(points)) if errors[i] is None]
+        if missing:
+            for i, (error, wallTime) in zip(missing, timedMap([points[i] for i in missing])):
+                self.record(points[i], error, wallTime, *arguments)
+                errors[i] = error
+        return errors
@@ -0,0 +1,156 @@
+import numpy as np
+import scipy.sparse as sparse
+from enum import Enum
+from reservoir import JITKernel as jit
+
+class Backend(Enum):
+    NumPy = 0
+    JIT = 1     # Numba compiled loops - falls back to NumPy when Numba is not installed
+
+
+def useJIT(backend, *activations):
+    return backend == Backend.JIT and jit.supports(*activations)
+
+
+def harvestStates(inputData, inputWeight, reservoirWeight, leakingRate, activation, initialState, states=None,
+                  backend=Backend.NumPy, projection=None):
+    """
+    Runs the leaky-integrator recurrence x(t) = (1-a) x(t-1) + a f(W_in u(t) + W x(t-1)) over the input data.
+    The input projection of all the time steps is computed up front with one GEMM, and the loop itself works on
+    preallocated buffers with in-place ufuncs, so the only per step work is the recurrent mat-vec.
+
+    :param inputData: T X D
+    :param inputWeight: Nx X D
+    :param reservoirWeight: Nx X Nx (dense or scipy sparse)
+    :param leakingRate: leaking rate of the reservoir
+    :param activation: reservoir activation function - called as activation(x, out=x)
+    :param initialState: state before the first time step (not modified)
+                         The states are kept in the precision of the reservoir weight matrix.
+    :param states: optional T X Nx array which receives the state of every time step
+    :param backend: Backend.JIT runs the whole loop compiled (see JITKernel)
+    :param projection: optional precomputed input projection (T X Nx) of the input data
+    :return: the state after the last time step
+    """
+    if projection is None and useJIT(backend, activation):
+        return jit.harvestStates(inputData, inputWeight, reservoirWeight, leakingRate, activation, initialState, states)
+
+    inputN = inputData.shape[0]
+    internalState = np.array(initialState, dtype=reservoirWeight.dtype)
+    if inputN == 0:
+        return internalState
+
+    # Input projection of all the time steps - T X Nx
+    if projection is None:
+        projection = np.dot(np.asarray(inputData, dtype=inputWeight.dtype), inputWeight.T)
+
+    isSparse = sparse.issparse(reservoirWeight)
+    preActivation = np.empty_like(internalState)
+    for t in range(inputN):
+        # Recurrent term
+        if isSparse:
+            preActivation[:] = reservoirWeight.dot(internalState)
+        else:
+            np.dot(reservoirWeight, internalState, out=preActivation)
+
+        # Activation and leaky blend - all in place
+        preActivation += projection[t]
+        activation(preActivation, out=preActivation)
+        preActivation *= leakingRate
+        internalState *= (1.0 - leakingRate)
+        internalState += preActivation
+
+        if states is not None:
+            states[t] = internalState
+
+    return internalState
+
+
+def harvestBatchStates(inputData, inputWeight, reservoirWeight, leakingRate, activation, initialStates, states=None):
+    """
+    Runs the recurrence for B independent sequences at once - one B X Nx by Nx X Nx matmul per time step instead of
+    B mat-vecs.
+
+    :param inputData: B X T X D
+    :param inputWeight: Nx X D
+    :param reservoirWeight: Nx X Nx (dense or scipy sparse)
+    :param leakingRate: leaking rate of the reservoir
+    :param activation: reservoir activation function - called as activation(x, out=x)
+    :param initialStates: B X Nx states before the first time step (not modified)
+    :param states: optional B X T X Nx array which receives the states of every time step
+    :return: B X Nx states after the last time step
+    """
+    inputN = inputData.shape[1]
+    internalStates = np.array(initialStates, dtype=reservoirWeight.dtype)
+    if inputN == 0:
+        return internalStates
+
+    # Input projection of all the sequences and time steps - B X T X Nx
+    projection = np.dot(np.asarray(inputData, dtype=inputWeight.dtype), inputWeight.T)
+
+    isSparse = sparse.issparse(reservoirWeight)
+    preActivation = np.empty_like(internalStates)
+    for t in range(inputN):
+        # Recurrent term of all the sequences - (W X^T)^T
+        if isSparse:
+            preActivation[:] = reservoirWeight.dot(internalStates.T).T
+        else:
+            np.dot(internalStates, reservoirWeight.T, out=preActivation)
+
+        preActivation += projection[:, t]
+        activation(preActivation, out=preActivation)
+        preActivation *= leakingRate
+        internalStates *= (1.0 - leakingRate)
+        internalStates += preActivation
+
+        if states is not None:
+            states[:, t] = internalStates
+
+    return internalStates
+
+
+def generate(inputVector, inputWeight, reservoirWeight, outputWeight, leakingRate, activation, outputActivation,
+             initialState, inputColumns, outputColumns, lags, trajectory, historyLength, backend=Backend.NumPy):
+    """
+    Closed-loop (autoregressive) run of a trained reservoir - the outputs of every step are written into the input
+    columns of the next one.
+
+    :param inputVector: D input of the first step - the columns which are not fed back (eg. bias) keep these values
+    :param outputWeight: Ny X Nx
+    :param initialState: state before the first step (not modified)
+    :param inputColumns, outputColumns, lags: input column inputColumns[k] receives output outputColumns[k] from
+                                              lags[k] steps back
+    :param trajectory: (historyLength + horizon) X Ny - the known outputs before the first step, followed by the
+                       rows the generated outputs are written into
+    :param historyLength: number of known outputs at the top of the trajectory
+    :param backend: Backend.JIT runs the whole loop compiled (see JITKernel)
+    :return: the state after the last step
+    """
+    if useJIT(backend, activation, outputActivation):
+        return jit.generate(inputVector, inputWeight, reservoirWeight, outputWeight, leakingRate, activation,
+                            outputActivation, initialState, inputColumns, outputColumns, lags, trajectory,
+                            historyLength)
+
+    internalState = np.array(initialState, dtype=reservoirWeight.dtype)
+    query = np.array(inputVector, dtype=inputWeight.dtype)
+    feedback = list(zip(inputColumns, outputColumns, lags))
+    isSparse = sparse.issparse(reservoirWeight)
+    preActivation = np.empty_like(internalState)
+    for t in range(trajectory.shape[0] - historyLength):
+        if isSparse:
+            preActivation[:] = reservoirWeight.dot(internalState)
+        else:
+            np.dot(reservoirWeight, internalState, out=preActivation)
+        preActivation += np.dot(inputWeight, query)
+        activation(preActivation, out=preActivation)
+        preActivation *= leakingRate
+        internalState *= (1.0 - leakingRate)
+        internalState += preActivation
+
+        # Output of this step, then feed back the (lagged) outputs which are available
+        row = historyLength + t
+        trajectory[row] = outputActivation(np.dot(outputWeight, internalState))
+        for inputColumn, outputColumn, lag in feedback:
+            if row + 1 - lag >= 0:
+                query[inputColumn] = trajectory[row + 1 - lag, outputColumn]
+
+    return internalState
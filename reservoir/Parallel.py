@@ -0,0 +1,335 @@
+import numpy as np
+import random
+import time
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+
+# Process pool helpers for the tuners. The large arrays of an objective (data and fixed weight matrices) are copied
+# into shared memory once - the workers receive only the names of the blocks and attach to them.
+
+
+class SharedArray(object):
+    """
+    An array in a shared memory block. Pickles to the name of the block, so sending it to a worker costs nothing.
+    """
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.owner = True
+        self.block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.block.buf)
+        self.array[...] = array
+
+    def __getstate__(self):
+        return self.block.name, self.shape, self.dtype.str
+
+    def __setstate__(self, state):
+        name, self.shape, dtype = state
+        self.dtype = np.dtype(dtype)
+        self.owner = False
+        self.block = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.block.buf)
+        self.array.flags.writeable = False
+
+    def close(self):
+        self.array = None
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+
+class SharesArrays(object):
+    """
+    Mixin for the tuners - while shareArrays() is in effect, pickling the object (eg. its bound objective method)
+    sends the numpy array attributes as shared memory handles instead of their data
+    """
+    def shareArrays(self):
+        self.sharedArrays = {}
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray) and value.nbytes > 0:
+                self.sharedArrays[name] = SharedArray(value)
+
+    def releaseArrays(self):
+        for sharedArray in getattr(self, "sharedArrays", {}).values():
+            sharedArray.close()
+        self.sharedArrays = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(getattr(self, "sharedArrays", {}))
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.sharedArrays = {}
+        for name, value in state.items():
+            if isinstance(value, SharedArray):
+                # Keep the handle, the array is only valid while its block is open
+                self.sharedArrays[name] = value
+                setattr(self, name, value.array)
+
+
+# Objective of the current worker process - set once by the pool initializer
+_objective = None
+
+
+def _initialize(objective):
+    global _objective
+    _objective = objective
+
+
+def evaluate(x):
+    """
+    Module level (hence picklable by reference) function evaluating the objective of the worker
+    """
+    return _objective(x)
+
+
+def timedEvaluate(x):
+    """
+    :return: error and wall time of the evaluation (see Journal.map)
+    """
+    start = time.time()
+    error = _objective(x)
+    return error, time.time() - start
+
+
+# Number of the first trial of the task run in this process (see firstTrial)
+_firstTrial = 0
+
+
+def firstTrial():
+    """
+    :return: the number of the first trial of the running task - the trials of a point are numbered 0, 1, ... across
+             its chunks, so an objective can give every trial its own pre-generated topology (see TopologyPool)
+    """
+    return _firstTrial
+
+
+def _runTrials(task):
+    # One (point, chunk of trials) task - the random generators (numpy and the random module used by networkx)
+    # are seeded per task, so the result does not depend on which process runs it
+    global _firstTrial
+    index, x, count, seed, arguments, first = task
+    np.random.seed(seed)
+    random.seed(seed)
+    _firstTrial = first
+    start = time.time()
+    try:
+        error = _objective(x, count, *arguments)
+    finally:
+        _firstTrial = 0
+    return index, error, time.time() - start
+
+
+class WorkerPool(object):
+    def __init__(self, workers, objective):
+        """
+        A process pool where every worker holds its own copy of the objective - it is pickled once per worker,
+        not once per evaluation. Use evaluate as the function and map as the DE workers argument.
+
+        :param workers: number of processes - 1 evaluates in this process
+        :param objective: picklable callable, eg. the bound objective method of a tuner which shares its arrays
+        """
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, initializer=_initialize, initargs=(objective,))
+        else:
+            self.pool = None
+            _initialize(objective)
+
+    def map(self, function, iterable):
+        if self.pool is None:
+            return list(map(function, iterable))
+        return self.pool.map(function, iterable)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TrialEvaluator(object):
+    def __init__(self, objective, workers=1, chunkSize=10, journal=None):
+        """
+        Evaluates objectives which average the error of random trials (eg. reservoirs drawn from a topology) at many
+        points. Every (point, chunk of trials) pair is an independent task, and the tasks run on a process pool.
+
+        :param objective: objective(x, count, *arguments) - average error of count trials at point x. Pickled once
+                          per worker.
+        :param workers: number of processes - 1 runs the tasks in this process
+        :param chunkSize: number of trials per task
+        :param journal: optional Journal - every task is recorded, and the recorded tasks are not run again
+        """
+        self.objective = objective
+        self.journal = journal
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.pool = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self.pool = WorkerPool(self.workers, self.objective)
+        else:
+            _initialize(self.objective)
+        return self
+
+    def __exit__(self, *args):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def evaluate(self, points, repetitions, seed, arguments=(), callback=None):
+        """
+        :param points: P X d
+        :param repetitions: number of trials per point
+        :param seed: base seed of the tasks - the result is the same for any number of workers
+        :param arguments: extra arguments of the objective
+        :param callback: callback(x, error) - called as soon as all the trials of a point are done
+        :return: average error of each point (P)
+        """
+        chunks = len(range(0, repetitions, self.chunkSize))
+        tasks = []
+        for index in range(points.shape[0]):
+            for start in range(0, repetitions, self.chunkSize):
+                tasks.append((len(tasks), points[index], min(self.chunkSize, repetitions - start), seed + len(tasks),
+                              arguments, start))
+
+        # Error sums of the chunks, collected as the tasks finish - a point is summed in chunk order once all its
+        # chunks are in, so the result does not depend on the completion order
+        chunkErrors = np.zeros(len(tasks))
+        remaining = np.full(points.shape[0], chunks)
+        errors = np.zeros(points.shape[0])
+
+        # The tasks recorded in the journal are replayed instead of run
+        counts = [task[2] for task in tasks]
+        replayed = []
+        if self.journal is not None:
+            pending = []
+            for task in tasks:
+                taskIndex, x, count, taskSeed, taskArguments, first = task
+                error = self.journal.lookup(x, count, taskSeed, *taskArguments)
+                if error is None:
+                    pending.append(task)
+                else:
+                    replayed.append((taskIndex, error, None))
+            tasks = pending
+
+        if self.pool is None:
+            results = (_runTrials(task) for task in tasks)
+        else:
+            results = self.pool.pool.imap_unordered(_runTrials, tasks)
+        byIndex = dict((task[0], task) for task in tasks)
+        for taskIndex, error, wallTime in itertools.chain(replayed, results):
+            if wallTime is not None and self.journal is not None:
+                taskIndex, x, count, taskSeed, taskArguments, first = byIndex[taskIndex]
+                self.journal.record(x, error, wallTime, count, taskSeed, *taskArguments)
+            chunkErrors[taskIndex] = error * counts[taskIndex]
+            index = taskIndex // chunks
+            remaining[index] -= 1
+            if remaining[index] == 0:
+                errors[index] = np.sum(chunkErrors[index * chunks:(index + 1) * chunks]) / repetitions
+                if callback is not None:
+                    callback(points[index], errors[index])
+        return errors
+
+
+def gridPoints(ranges):
+    """
+    :return: the grid of optimize.brute for the ranges (tuple of slices), and its points (P X d)
+    """
+    dimensions = len(ranges)
+    grid = np.mgrid[ranges[0] if dimensions == 1 else ranges]
+    if dimensions == 1:
+        return grid, grid.reshape((-1, 1))
+    return grid, grid.reshape((dimensions, -1)).T
+
+
+def baseSeed(seed, taskCount):
+    # A random base seed when none is given, leaving room for the task offsets
+    if seed is None:
+        seed = np.random.randint(2**31 - 1 - taskCount)
+    return seed
+
+
+def sessionSeed(journal, seed, taskCount):
+    # With a journal the base seed is the recorded one, so that a restarted search draws the same tasks
+    seed = baseSeed(seed, taskCount)
+    return seed if journal is None else journal.sessionSeed(seed)
+
+
+def bruteGrid(objective, ranges, repetitions, chunkSize=10, workers=1, seed=None, callback=None, journal=None,
+              arguments=()):
+    """
+    Grid search with a TrialEvaluator. The grid and the returned values are the same as
+    optimize.brute(objective, ranges, finish=None, full_output=True).
+
+    :param objective: objective(x, count) - average error of count trials at grid point x (x is an array of the
+                      grid coordinates, as in optimize.brute)
+    :param ranges: tuple of slices, as in optimize.brute
+    :param repetitions: number of trials per grid point
+    :param seed: base seed of the tasks - with a seed the result is the same for any number of workers
+    :param callback: callback(x, error) - called as soon as all the trials of a grid point are done
+    :param journal: optional Journal - a restarted search replays the finished tasks (see sessionSeed)
+    :param arguments: extra arguments of the objective
+    :return: xmin, Jmin, grid, Jout
+    """
+    grid, points = gridPoints(ranges)
+    seed = sessionSeed(journal, seed, points.shape[0] * repetitions)
+    with TrialEvaluator(objective, workers, chunkSize, journal) as evaluator:
+        errors = evaluator.evaluate(points, repetitions, seed, arguments, callback)
+
+    # First minimum in grid order, as optimize.brute
+    best = np.argmin(errors)
+    xmin = points[best][0] if len(ranges) == 1 else points[best]
+    return xmin, errors[best], grid, errors.reshape(grid.shape[1:] if len(ranges) > 1 else grid.shape)
+
+
+def successiveHalving(objective, points, repetitions, eta=3, minimumRepetitions=2, minimumFidelity=0.1,
+                      chunkSize=10, workers=1, seed=None, callback=None, journal=None):
+    """
+    Successive halving - all the candidates get a small budget (few trials at a low fidelity, eg. a short validation
+    horizon), the best 1/eta of them are kept and get eta times the budget, until the last few are evaluated with the
+    full repetitions at full fidelity.
+
+    :param objective: objective(x, count, fidelity) - average error of count trials at point x, evaluated at the
+                      fidelity in (0, 1]
+    :param points: candidates (P X d)
+    :param repetitions: number of trials in the last round
+    :param eta: reduction factor between the rounds
+    :param minimumRepetitions, minimumFidelity: smallest budget of the first round
+    :param callback: callback(x, error) - called for every evaluated candidate
+    :param journal: optional Journal - a restarted search replays the finished tasks
+    :return: xmin (scalar for one dimensional points, as optimize.brute), Jmin, survivors (the points evaluated in
+             the last round), their errors
+    """
+    # Number of rounds until at most eta candidates are left
+    rounds = 1
+    while points.shape[0] > eta ** rounds:
+        rounds += 1
+
+    seed = sessionSeed(journal, seed, rounds * points.shape[0] * repetitions)
+    candidates = points
+    with TrialEvaluator(objective, workers, chunkSize, journal) as evaluator:
+        for rung in range(rounds):
+            fraction = float(eta) ** (rung - rounds + 1)
+            roundRepetitions = max(min(minimumRepetitions, repetitions), int(np.ceil(repetitions * fraction)))
+            fidelity = max(min(minimumFidelity, 1.0), fraction)
+            errors = evaluator.evaluate(candidates, roundRepetitions, seed + rung * points.shape[0] * repetitions,
+                                        (fidelity,), callback)
+            if rung < rounds - 1:
+                # Keep the best 1/eta (a stable sort, so that ties keep the grid order)
+                order = np.argsort(errors, kind='stable')
+                keep = np.sort(order[:int(np.ceil(candidates.shape[0] / float(eta)))])
+                candidates = candidates[keep]
+
+    best = np.argmin(errors)
+    xmin = candidates[best][0] if points.shape[1] == 1 else candidates[best]
+    return xmin, errors[best], candidates, errors
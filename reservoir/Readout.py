@@ -0,0 +1,50 @@
+import numpy as np
+import scipy.linalg as la
+
+class RidgeReadout(object):
+    """
+    Ridge regression readout solved from the normal equations. The state Gram matrix X'X and the cross term X'Y are
+    accumulated once (possibly over several chunks of states), and all the outputs are solved with one Cholesky
+    factorisation, so the cost hardly depends on the number of outputs.
+
+    The solve is exact - unlike the lsmr readout it replaces (damp=1e-8, stopped at lsmr's 1e-6 tolerance), whose
+    early stop was the actual regularization. The ridge regularization is on another scale than lsmr's damp
+    (regularization = damp ** 2, ie. the old damp is a ridge of 1e-16), and an exact solve with a tiny ridge gives
+    large output weights and unstable closed-loop predictions. The default of 1e-2 was chosen by comparing the
+    closed-loop error with the old readout - it is lower and never diverges where the old one did.
+    """
+    def __init__(self, size, outputSize, regularization=1e-2, dtype=np.float64):
+        """
+        :param size: size of the reservoir (Nx)
+        :param outputSize: number of outputs (Ny)
+        :param regularization: ridge regularization added to the diagonal of X'X (lsmr's damp squared)
+        :param dtype: precision of the accumulation and the solve - the states are cast to it before accumulating
+        """
+        self.size = size
+        self.outputSize = outputSize
+        self.regularization = regularization
+        self.dtype = dtype
+        self.gram = np.zeros((size, size), dtype=dtype)
+        self.cross = np.zeros((size, outputSize), dtype=dtype)
+
+    def accumulate(self, states, targets):
+        """
+        :param states: T X Nx
+        :param targets: T X Ny
+        """
+        states = np.asarray(states, dtype=self.dtype)
+        targets = np.asarray(targets, dtype=self.dtype)
+        self.gram += np.dot(states.T, states)
+        self.cross += np.dot(states.T, targets)
+
+    def solve(self):
+        """
+        :return: the output weights (Ny X Nx)
+        """
+        A = self.gram + self.regularization * np.identity(self.size, dtype=self.dtype)
+        try:
+            weight = la.cho_solve(la.cho_factor(A), self.cross)
+        except la.LinAlgError:
+            # Not positive definite for a (close to) zero regularization - fall back to least squares
+            weight = la.lstsq(A, self.cross)[0]
+        return weight.T
@@ -3,30 +3,33 @@ import networkx as nx
 import matplotlib.pyplot as plt
 
 class ClassicReservoirTopology:
-    def __init__(self, size):
+    def __init__(self, size, dtype=np.float64):
+        self.dtype = dtype
         self.size = size
 
     def generateWeightMatrix(self):
-        reservoirWeightRandom = np.random.rand(self.size, self.size)
+        reservoirWeightRandom = np.random.rand(self.size, self.size).astype(self.dtype, copy=False)
         return reservoirWeightRandom
 
 class ClassicInputTopology:
-    def __init__(self, inputSize, reservoirSize):
+    def __init__(self, inputSize, reservoirSize, dtype=np.float64):
+        self.dtype = dtype
         self.inputSize = inputSize
         self.reservoirSize = reservoirSize
 
     def generateWeightMatrix(self):
-        inputWeightRandom = np.random.rand(self.reservoirSize, self.inputSize)
+        inputWeightRandom = np.random.rand(self.reservoirSize, self.inputSize).astype(self.dtype, copy=False)
         return inputWeightRandom
 
 class RandomInputTopology:
-    def __init__(self, inputSize, reservoirSize, inputConnectivity):
+    def __init__(self, inputSize, reservoirSize, inputConnectivity, dtype=np.float64):
+        self.dtype = dtype
         self.inputSize = inputSize
         self.reservoirSize = reservoirSize
         self.inputConnectivity = inputConnectivity
 
     def generateConnectivityMatrix(self):
-        connectivity = np.zeros((self.reservoirSize, self.inputSize))
+        connectivity = np.zeros((self.reservoirSize, self.inputSize), dtype=self.dtype)
         for i in range(self.reservoirSize):
             indices = np.random.choice(self.inputSize, size=int(self.inputConnectivity * self.inputSize), replace=False)
             connectivity[i, indices] = 1.0
@@ -34,18 +37,19 @@ class RandomInputTopology:
 
     def generateWeightMatrix(self):
         # Multiply with randomly generated matrix with connected matrix
-        random = np.random.rand(self.reservoirSize, self.inputSize)
+        random = np.random.rand(self.reservoirSize, self.inputSize).astype(self.dtype, copy=False)
         weight = random * self.generateConnectivityMatrix()
         return weight
 
 class RandomReservoirTopology:
-    def __init__(self, size, connectivity):
+    def __init__(self, size, connectivity, dtype=np.float64):
+        self.dtype = dtype
         self.size = size
         self.connectivity = connectivity
 
     def generateConnectivityMatrix(self):
         #Initialize the matrix to zeros
-        connectivity = np.zeros((self.size, self.size))
+        connectivity = np.zeros((self.size, self.size), dtype=self.dtype)
         for i in range(self.size):
             indices = np.random.choice(self.size, size=int(self.connectivity * self.size), replace=False)
             connectivity[i, indices] = 1.0
@@ -53,56 +57,59 @@ class RandomReservoirTopology:
 
     def generateWeightMatrix(self):
         # Multiply with randomly generated matrix with connected matrix
-        random = np.random.rand(self.size, self.size)
+        random = np.random.rand(self.size, self.size).astype(self.dtype, copy=False)
         weight = random * self.generateConnectivityMatrix()
         return weight
 
 class ErdosRenyiTopology:
-    def __init__(self, size, probability):
+    def __init__(self, size, probability, dtype=np.float64):
+        self.dtype = dtype
         self.size = size
         self.probability = probability
         self.network = nx.erdos_renyi_graph(self.size, self.probability)
 
     def generateConnectivityMatrix(self):
-        connectivity = np.asarray(nx.to_numpy_matrix(self.network))
+        connectivity = np.asarray(nx.to_numpy_matrix(self.network), dtype=self.dtype)
         return connectivity
 
     def generateWeightMatrix(self):
         # Multiply with randomly generated matrix with connected matrix
-        random = np.random.rand(self.size, self.size)
+        random = np.random.rand(self.size, self.size).astype(self.dtype, copy=False)
         weight = random * self.generateConnectivityMatrix()
         return weight
 
 class SmallWorldGraphs:
-    def __init__(self, size, meanDegree, beta):
+    def __init__(self, size, meanDegree, beta, dtype=np.float64):
+        self.dtype = dtype
         self.size = size
         self.meanDegree = meanDegree
         self.beta = beta
         self.network = nx.newman_watts_strogatz_graph(self.size,self.meanDegree,self.beta) #No edges are removed in newman implementation (So, atleast we get a ring lattice)
 
     def generateConnectivityMatrix(self):
-        connectivity = np.asarray(nx.to_numpy_matrix(self.network))
+        connectivity = np.asarray(nx.to_numpy_matrix(self.network), dtype=self.dtype)
         return connectivity
 
     def generateWeightMatrix(self):
         # Multiply with randomly generated matrix with connected matrix
-        random = np.random.rand(self.size, self.size)
+        random = np.random.rand(self.size, self.size).astype(self.dtype, copy=False)
         weight = random * self.generateConnectivityMatrix()
         return weight
 
 class ScaleFreeNetworks:
-    def __init__(self, size, attachmentCount):
+    def __init__(self, size, attachmentCount, dtype=np.float64):
+        self.dtype = dtype
         self.size = size
         self.m = attachmentCount
         self.network = nx.barabasi_albert_graph(self.size, self.m)
 
     def generateConnectivityMatrix(self):
-        connectivity = np.asarray(nx.to_numpy_matrix(self.network))
+        connectivity = np.asarray(nx.to_numpy_matrix(self.network), dtype=self.dtype)
         return connectivity
 
     def generateWeightMatrix(self):
         # Multiply with randomly generated matrix with connected matrix
-        random = np.random.rand(self.size, self.size)
+        random = np.random.rand(self.size, self.size).astype(self.dtype, copy=False)
         weight = random * self.generateConnectivityMatrix()
         return weight
 
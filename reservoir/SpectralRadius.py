@@ -0,0 +1,114 @@
+import numpy as np
+import warnings
+import scipy.linalg as la
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sla
+from reservoir import Cache as cache
+
+# Spectral radius estimators - each one is called with the (scaled) reservoir weight matrix, dense or sparse
+
+
+class EigenValues(object):
+    """
+    Exact spectral radius from the full dense eigen-decomposition - O(Nx^3)
+    """
+    def __call__(self, weight):
+        if sparse.issparse(weight):
+            weight = weight.toarray()
+        return np.max(np.abs(la.eigvals(weight)))
+
+
+class Arnoldi(object):
+    """
+    Largest magnitude eigenvalue using ARPACK (implicitly restarted Arnoldi) - only needs mat-vec products,
+    so it works directly on sparse matrices
+    """
+    def __init__(self, tolerance=0.0):
+        self.tolerance = tolerance
+
+    def __call__(self, weight):
+        # ARPACK needs k < Nx - 1, so fall back to the dense solver for tiny reservoirs
+        if weight.shape[0] <= 2:
+            return EigenValues()(weight)
+        # ARPACK does not converge to tolerance 0 (machine precision) in single precision
+        if weight.dtype != np.float64:
+            weight = weight.astype(np.float64)
+        eigenValues = sla.eigs(weight, k=1, which='LM', tol=self.tolerance, return_eigenvectors=False)
+        return np.max(np.abs(eigenValues))
+
+
+class PowerIteration(object):
+    """
+    Block power (subspace) iteration - a block of blockSize vectors is multiplied by W and re-orthonormalised, and the
+    radius is the largest eigenvalue magnitude of the small projected matrix Q' W Q (Rayleigh-Ritz). Unlike the
+    growth rate of ||W^k x||, this also converges when the dominant eigenvalues are a complex conjugate pair (or
+    several eigenvalues of the same magnitude, up to blockSize of them). When it has not converged after
+    maxIterations, eg. when more eigenvalues lie close to the spectral radius than the block holds, it warns and
+    falls back to Arnoldi.
+    """
+    def __init__(self, tolerance=1e-6, maxIterations=1000, seed=42, blockSize=4):
+        self.tolerance = tolerance
+        self.maxIterations = maxIterations
+        self.seed = seed
+        self.blockSize = blockSize
+
+    def __call__(self, weight):
+        n = weight.shape[0]
+        blockSize = min(self.blockSize, n)
+        q, r = np.linalg.qr(np.random.RandomState(self.seed).rand(n, blockSize) - 0.5)
+        for i in range(self.maxIterations):
+            y = np.asarray(weight.dot(q), dtype=np.float64)
+            values, vectors = la.eig(np.dot(q.T, y))
+            largest = np.argmax(np.abs(values))
+            estimate = np.abs(values[largest])
+            if estimate == 0.0 and not np.any(y):
+                return 0.0
+            # Converged when the dominant Ritz pair is an eigenpair of W up to the tolerance - the residual, not the
+            # change of the estimate, which can stall far from the radius
+            residual = np.linalg.norm(np.dot(y, vectors[:, largest]) - values[largest] * np.dot(q, vectors[:, largest]))
+            if residual <= self.tolerance * estimate:
+                return estimate
+            q, r = np.linalg.qr(y)
+        warnings.warn("PowerIteration did not converge in " + str(self.maxIterations) +
+                      " iterations - falling back to Arnoldi", RuntimeWarning)
+        return Arnoldi()(weight)
+
+
+class CircularLaw(object):
+    """
+    Analytic estimate for matrices with i.i.d. entries (the Classic and Random topologies). The bulk of the spectrum
+    lies in a disc of radius sqrt(Nx) * std, while a non-zero mean adds an outlier eigenvalue close to Nx * mean.
+    Costs O(nnz), but it is only an approximation and should not be used for the graph based topologies.
+    """
+    def __call__(self, weight):
+        n = weight.shape[0]
+        if sparse.issparse(weight):
+            values = weight.data
+        else:
+            values = weight.ravel()
+        mean = np.sum(values) / float(n * n)
+        variance = np.sum(values ** 2) / float(n * n) - mean ** 2
+        return max(abs(n * mean), np.sqrt(n * max(variance, 0.0)))
+
+
+# Radii memoised by the fingerprint of the random matrix, the reservoir scaling and the estimator
+radiusCache = cache.LRUCache(maxSize=256)
+
+
+def estimatorKey(estimator):
+    return type(estimator).__name__, tuple(sorted(vars(estimator).items()))
+
+
+def cachedSpectralRadius(weight, weightFingerprint, reservoirScaling, estimator):
+    """
+    :param weight: the scaled reservoir weight matrix
+    :param weightFingerprint: fingerprint of the random matrix the weight was generated from
+    :param reservoirScaling: the scaling applied to the random matrix
+    :param estimator: one of the estimators above
+    """
+    key = (weightFingerprint, reservoirScaling, estimatorKey(estimator))
+    radius = radiusCache.get(key)
+    if radius is None:
+        radius = estimator(weight)
+        radiusCache.put(key, radius)
+    return radius
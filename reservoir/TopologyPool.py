@@ -0,0 +1,136 @@
+import numpy as np
+import networkx as nx
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+from enum import Enum
+from reservoir import Cache as cache
+
+# Pre-generated connectivity masks for the topology tuners. Building a networkx graph per repetition is pure Python
+# and often costs more than training the reservoir - the pool generates the mask of a (topology, parameters,
+# repetition) triple once, when it is first needed, and stores it bit packed in a .npy file, so every process (the
+# tuner and its workers) and every later evaluation of the same repetition (eg. the rounds of successive halving or
+# the shortlist refinement) reads it back instead of building the graph again.
+#
+# The repetitions of a point get their own masks (repetition i is mask i), so they are independent topologies as
+# before - the trials of a task are numbered with parallel.firstTrial().
+
+
+class Topology(Enum):
+    ErdosRenyi = 1      # parameters: probability
+    ScaleFree = 2       # parameters: attachment count
+    SmallWorld = 3      # parameters: mean degree, beta
+
+
+class TopologyPool(object):
+    def __init__(self, size, seed=None, directory=None, cacheSize=256, maxBytes=2**30):
+        """
+        :param size: reservoir size
+        :param seed: seed of the masks - the same seed gives the same masks in every process
+        :param directory: where the mask files are kept - a temporary directory (removed with the pool) by default.
+                          With a fixed directory the masks are reused across tuning sessions.
+        :param cacheSize: number of masks kept in memory per process
+        :param maxBytes: disk budget of the mask files written by a process - the least recently written files are
+                         removed beyond it (and generated again if needed). None keeps all the files.
+        """
+        self.size = size
+        self.seed = int(np.random.randint(2**31 - 1)) if seed is None else int(seed)
+        self.cacheSize = cacheSize
+        self.maxBytes = maxBytes
+        self.masks = cache.LRUCache(cacheSize)
+        self.written = OrderedDict()
+        self.writtenBytes = 0
+        if directory is None:
+            self.directory = tempfile.mkdtemp(prefix="topologies")
+            weakref.finalize(self, shutil.rmtree, self.directory, True)
+        else:
+            self.directory = directory
+            os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # The workers receive only the location of the masks - they read the files themselves
+        state = self.__dict__.copy()
+        state["masks"] = None
+        state["written"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.masks = cache.LRUCache(self.cacheSize)
+        self.written = OrderedDict()
+        self.writtenBytes = 0
+
+    def __generate(self, topology, parameters, random):
+        # One symmetric (undirected graph) mask
+        if topology == Topology.ErdosRenyi:
+            # G(n, p) - each pair is connected with the probability, drawn for the whole upper triangle at once
+            probability, = parameters
+            mask = np.triu(random.rand(self.size, self.size) < probability, 1)
+            return mask | mask.T
+        if topology == Topology.ScaleFree:
+            attachmentCount, = parameters
+            network = nx.barabasi_albert_graph(self.size, int(attachmentCount), seed=random)
+        else:
+            meanDegree, beta = parameters
+            network = nx.newman_watts_strogatz_graph(self.size, int(meanDegree), beta, seed=random)
+        mask = np.zeros((self.size, self.size), dtype=bool)
+        edges = np.array(network.edges(), dtype=int).reshape((-1, 2))
+        mask[edges[:, 0], edges[:, 1]] = True
+        mask[edges[:, 1], edges[:, 0]] = True
+        return mask
+
+    def __write(self, fileName, packed):
+        # Written to a temporary file and renamed, so another process never sees a partial file
+        handle, temporaryName = tempfile.mkstemp(dir=self.directory, suffix=".npy")
+        with os.fdopen(handle, "wb") as maskFile:
+            np.save(maskFile, packed)
+        os.replace(temporaryName, fileName)
+
+        if self.maxBytes is None:
+            return
+        self.written[fileName] = packed.nbytes
+        self.writtenBytes += packed.nbytes
+        while self.writtenBytes > self.maxBytes and len(self.written) > 1:
+            oldestName, nbytes = self.written.popitem(last=False)
+            self.writtenBytes -= nbytes
+            try:
+                os.remove(oldestName)
+            except FileNotFoundError:
+                pass
+
+    def packedMask(self, topology, *parameters, repetition=0):
+        """
+        :return: the bit packed mask of the repetition - size X ceil(size/8) (np.unpackbits along the last axis)
+        """
+        pair = cache.fingerprint(topology.name, self.size, self.seed, *[float(p) for p in parameters])
+        key = pair + "-" + str(int(repetition))
+        packed = self.masks.get(key)
+        if packed is not None:
+            return packed
+
+        fileName = os.path.join(self.directory, key + ".npy")
+        try:
+            packed = np.load(fileName)
+        except (FileNotFoundError, ValueError):
+            # The seed of the mask is derived from the pair and the repetition, so the masks do not depend on the
+            # generation order or on the process generating them
+            random = np.random.RandomState([self.seed, int(pair[:8], 16), int(repetition)])
+            packed = np.packbits(self.__generate(topology, parameters, random), axis=-1)
+            self.__write(fileName, packed)
+
+        self.masks.put(key, packed)
+        return packed
+
+    def mask(self, topology, *parameters, repetition=0, dtype=np.float64):
+        """
+        :return: the mask of the repetition (size X size, 0/1)
+        """
+        packed = self.packedMask(topology, *parameters, repetition=repetition)
+        return np.unpackbits(packed, axis=-1, count=self.size).astype(dtype)
+
+    def generateWeightMatrix(self, topology, *parameters, repetition=0, dtype=np.float64):
+        # As the generateWeightMatrix of the topologies - random weights on the connections of the mask
+        random = np.random.rand(self.size, self.size).astype(dtype, copy=False)
+        return random * self.mask(topology, *parameters, repetition=repetition, dtype=dtype)
@@ -0,0 +1,190 @@
+import numpy as np
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Per evaluation trace of the tuner objectives - the wall time of the phases of every evaluation (topology
+# generation, spectral normalisation, state harvesting, readout solve, warm-up, closed-loop forecast, garbage
+# collection) and the peak resident memory of the process, one JSON object per line. The exact peak memory of an
+# evaluation (tracemalloc) is opt-in, as tracing the allocations slows the evaluation down. The phases are marked in
+# the reservoir code with phase(name), which does nothing unless an evaluation is traced in the process.
+
+# Evaluation traced in this process
+_current = None
+
+
+class _Phase(object):
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _current is not None:
+            _current.enter(self.name)
+        return self
+
+    def __exit__(self, *args):
+        if _current is not None:
+            _current.exit()
+
+
+def phase(name):
+    """
+    Marks a phase of an evaluation - with trace.phase("harvest"): ...
+    Nested phases are exclusive, ie. the time of an inner phase is not counted in the outer one.
+    """
+    return _Phase(name)
+
+
+class Evaluation(object):
+    def __init__(self, fileName, x, memory=False, **arguments):
+        """
+        Traces one evaluation - the phases run inside the with block are timed, and the entry is appended to the
+        file when the block exits.
+
+        :param fileName: the trace file (JSON lines) - appended to by all the processes of a tuner
+        :param x: the evaluated parameters
+        :param memory: trace the peak memory allocated during the evaluation (tracemalloc) - otherwise only the peak
+                       resident memory of the process so far is recorded, which costs nothing
+        :param arguments: other values recorded with the entry (eg. the number of trials)
+        """
+        self.fileName = fileName
+        self.x = x
+        self.memory = memory
+        self.arguments = arguments
+        self.error = None
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            self.__add(self.stack[-1][0], now - self.stack[-1][1])
+        self.stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        name, start = self.stack.pop()
+        self.__add(name, now - start)
+        if self.stack:
+            self.stack[-1][1] = now
+
+    def __add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def __enter__(self):
+        global _current
+        self.previous = _current
+        self.phases = {}
+        self.stack = []
+        self.startedTracing = self.memory and not tracemalloc.is_tracing()
+        if self.startedTracing:
+            tracemalloc.start()
+        elif self.memory:
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        _current = self
+        return self
+
+    def __exit__(self, exceptionType, exception, tb):
+        global _current
+        wallTime = time.perf_counter() - self.start
+        _current = self.previous
+        entry = {"x": [float(value) for value in np.ravel(self.x)], "wallTime": wallTime, "phases": self.phases,
+                 "pid": os.getpid()}
+        if self.error is not None:
+            entry["error"] = float(self.error)
+        if exceptionType is not None:
+            entry["exception"] = exceptionType.__name__
+        if resource is not None:
+            entry["maxResident"] = maxResident()
+        if self.memory:
+            entry["peakMemory"] = tracemalloc.get_traced_memory()[1]
+            if self.startedTracing:
+                tracemalloc.stop()
+        entry.update(self.arguments)
+
+        # One short write in append mode - the lines of different processes do not interleave
+        with open(self.fileName, "a") as traceFile:
+            traceFile.write(json.dumps(entry, default=_plain) + "\n")
+        return False
+
+
+def maxResident():
+    # Peak resident memory of the process in bytes (ru_maxrss is in bytes on macOS, kilobytes elsewhere)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _plain(value):
+    # numpy scalars and arrays among the recorded values
+    return value.tolist() if isinstance(value, (np.generic, np.ndarray)) else str(value)
+
+
+def traced(objective):
+    """
+    Decorator of the tuner objectives - objective(self, x, *arguments) is traced into the file self.trace, unless
+    it is None, with the allocations traced when self.traceMemory is set
+    """
+    @functools.wraps(objective)
+    def tracedObjective(self, x, *arguments, **keywords):
+        if self.trace is None:
+            return objective(self, x, *arguments, **keywords)
+        with Evaluation(self.trace, x, getattr(self, "traceMemory", False), arguments=list(arguments),
+                        **keywords) as evaluation:
+            evaluation.error = objective(self, x, *arguments, **keywords)
+        return evaluation.error
+    return tracedObjective
+
+
+def summarize(fileName):
+    """
+    Where the tuning time goes
+    :return: list of (phase, total seconds, share of the total wall time, mean seconds per evaluation) sorted by the
+             total - "other" is the time outside the marked phases - the peak memory allocated by an evaluation
+             (None unless the allocations were traced) and the peak resident memory of the processes
+    """
+    totals = {}
+    wallTime = 0.0
+    evaluations = 0
+    peakMemory = None
+    maxResidentMemory = 0
+    with open(fileName) as traceFile:
+        for line in traceFile:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            evaluations += 1
+            wallTime += entry["wallTime"]
+            for name, seconds in entry["phases"].items():
+                totals[name] = totals.get(name, 0.0) + seconds
+            totals["other"] = totals.get("other", 0.0) + entry["wallTime"] - sum(entry["phases"].values())
+            if "peakMemory" in entry:
+                peakMemory = max(peakMemory or 0, entry["peakMemory"])
+            maxResidentMemory = max(maxResidentMemory, entry.get("maxResident", 0))
+
+    summary = [(name, total, total / wallTime if wallTime > 0.0 else 0.0, total / evaluations)
+               for name, total in totals.items()]
+    summary.sort(key=lambda row: row[1], reverse=True)
+    return summary, peakMemory, maxResidentMemory
+
+
+def printSummary(fileName):
+    summary, peakMemory, maxResidentMemory = summarize(fileName)
+    print("%-12s %12s %8s %12s" % ("Phase", "Total (s)", "Share", "Mean (ms)"))
+    for name, total, share, mean in summary:
+        print("%-12s %12.3f %7.1f%% %12.3f" % (name, total, 100.0 * share, 1000.0 * mean))
+    if peakMemory is not None:
+        print("Peak memory of an evaluation: %.1f MB" % (peakMemory / 2.0 ** 20))
+    print("Peak resident memory of a process: %.1f MB" % (maxResidentMemory / 2.0 ** 20))
+
+
+if __name__ == '__main__':
+    printSummary(sys.argv[1])
@@ -1,5 +1,7 @@
 import numpy as np
+import scipy.sparse as sparse
 from reservoir import EnhancedClassicTuner as tuner, ReservoirTopology as topology, classicESN as ESN, Utility as util
+from reservoir import ensembleESN, Trace as trace, Cache as cache
 from enum import Enum
 from performance import ErrorMetrics as metrics
 
@@ -46,20 +48,18 @@ def formFeatureVectors(data):
     return input, output
 
 def predictFuture(network, seed, horizon):
-    # Predict future values
-    predictedTestOutputData = []
-    lastAvailableData = seed
-    for i in range(horizon):
-        query = [1.0]
-        query.append(lastAvailableData)
+    # Predict future values - the input is [1.0, last output] (see formFeatureVectors)
+    seedInput = np.array([1.0, np.ravel(seed)[0]])
+    if(hasattr(network, "generate")):
+        return network.generate(horizon, seedInput)
 
+    predictedTestOutputData = np.zeros((horizon, 1))
+    query = seedInput.reshape((1,2))
+    for i in range(horizon):
         #Predict the next point
-        nextPoint = network.predict(np.array(query).reshape((1,2)))[0]
-        predictedTestOutputData.append(nextPoint)
+        predictedTestOutputData[i] = network.predict(query)[0]
+        query[0, 1] = predictedTestOutputData[i, 0]
 
-        lastAvailableData = nextPoint
-
-    predictedTestOutputData = np.array(predictedTestOutputData).reshape((horizon, 1))
     return predictedTestOutputData
 
 def tuneTrainPredict(trainingInputData, trainingOutputData, validationOutputData,
@@ -68,7 +68,7 @@ def tuneTrainPredict(trainingInputData, trainingOutputData, validationOutputData
                  inputScalingBound=(0.0,1.0),
                  reservoirScalingBound=(0.0,1.0),
                  leakingRateBound=(0.0,1.0),
-                 reservoirTopology=None):
+                 reservoirTopology=None, workers=1, seed=None):
 
     # Generate the input and reservoir weight matrices based on the reservoir topology
     inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
@@ -89,7 +89,9 @@ def tuneTrainPredict(trainingInputData, trainingOutputData, validationOutputData
                                              leakingRateBound=leakingRateBound,
                                              inputWeightMatrix=inputWeightMatrix,
                                              reservoirWeightMatrix=reservoirWeightMatrix,
-                                             minimizer=tuner.Minimizer.DifferentialEvolution)
+                                             minimizer=tuner.Minimizer.DifferentialEvolution,
+                                             workers=workers,
+                                             seed=seed)
     spectralRadiusOptimum, inputScalingOptimum, reservoirScalingOptimum, leakingRateOptimum = resTuner.getOptimalParameters()
 
     #Train
@@ -137,7 +139,11 @@ def tuneTrainPredict(trainingInputData, trainingOutputData, validationOutputData
 
 def tuneTrainPredictConnectivity(trainingInputData, trainingOutputData, validationOutputData,
                                             initialInputSeedForValidation, horizon, size=256,initialTransient=50,
-                                            resTopology = Topology.Random):
+                                            resTopology = Topology.Random, minimizer=None):
+
+    # Brute force by default - or eg. tuner.Minimizer.SuccessiveHalving
+    if minimizer is None:
+        minimizer = tuner.Minimizer.BruteForce
 
     # Other reservoir parameters
     spectralRadius = 0.79
@@ -153,7 +159,8 @@ def tuneTrainPredictConnectivity(trainingInputData, trainingOutputData, validati
                                                  initialSeed=initialInputSeedForValidation,
                                                  validationOutputData=validationOutputData,
                                                  spectralRadius=spectralRadius, inputScaling=inputScaling,
-                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate)
+                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                                                 minimizer=minimizer)
         reservoirConnectivityOptimum = resTuner.getOptimalParameters()
         inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
         reservoirWeightMatrix = topology.RandomReservoirTopology(size=size, connectivity=reservoirConnectivityOptimum).generateWeightMatrix()
@@ -166,7 +173,8 @@ def tuneTrainPredictConnectivity(trainingInputData, trainingOutputData, validati
                                                  initialSeed=initialInputSeedForValidation,
                                                  validationOutputData=validationOutputData,
                                                  spectralRadius=spectralRadius, inputScaling=inputScaling,
-                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate)
+                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                                                 minimizer=minimizer)
         probabilityOptimum = resTuner.getOptimalParameters()
         inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
         reservoirWeightMatrix = topology.ErdosRenyiTopology(size=size, probability=probabilityOptimum).generateWeightMatrix()
@@ -179,7 +187,8 @@ def tuneTrainPredictConnectivity(trainingInputData, trainingOutputData, validati
                                                  initialSeed=initialInputSeedForValidation,
                                                  validationOutputData=validationOutputData,
                                                  spectralRadius=spectralRadius, inputScaling=inputScaling,
-                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate)
+                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                                                 minimizer=minimizer)
         attachmentOptimum = resTuner.getOptimalParameters()
         inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
         reservoirWeightMatrix = topology.ScaleFreeNetworks(size=size, attachmentCount=attachmentOptimum).generateWeightMatrix()
@@ -191,7 +200,8 @@ def tuneTrainPredictConnectivity(trainingInputData, trainingOutputData, validati
                                                  initialSeed=initialInputSeedForValidation,
                                                  validationOutputData=validationOutputData,
                                                  spectralRadius=spectralRadius, inputScaling=inputScaling,
-                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate)
+                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                                                 minimizer=minimizer)
         meanDegreeOptimum, betaOptimum  = resTuner.getOptimalParameters()
         inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
         reservoirWeightMatrix = topology.SmallWorldGraphs(size=size, meanDegree=int(meanDegreeOptimum), beta=betaOptimum).generateWeightMatrix()
@@ -283,7 +293,11 @@ def tuneTrainPredictConnectivityNonBrute(trainingInputData, trainingOutputData,
 def tuneConnectivity(trainingInputData, trainingOutputData, validationOutputData,
                     initialInputSeedForValidation, horizon, testingActualOutputData,
                     size=256,initialTransient=50,
-                    resTopology = Topology.Classic):
+                    resTopology = Topology.Classic, minimizer=None):
+
+    # Brute force by default - or eg. tuner.Minimizer.SuccessiveHalving
+    if minimizer is None:
+        minimizer = tuner.Minimizer.BruteForce
 
     # Other reservoir parameters
     spectralRadius = 0.79
@@ -294,33 +308,26 @@ def tuneConnectivity(trainingInputData, trainingOutputData, validationOutputData
     # Optimal Parameters List
     optimalParameters = {}
 
+    # Arguments shared by all the repetition-averaged error estimates below
+    warmupFeatureVectors, warmTargetVectors = formFeatureVectors(validationOutputData)
+    errorArgs = dict(size=size, spectralRadius=spectralRadius, inputScaling=inputScaling,
+                     reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                     initialTransient=initialTransient, trainingInputData=trainingInputData,
+                     trainingOutputData=trainingOutputData,
+                     warmupInputData=warmupFeatureVectors[-initialTransient:],
+                     seed=validationOutputData[-1], horizon=horizon,
+                     actualOutputData=testingActualOutputData)
+
 
     if(resTopology == Topology.Classic):
-        # Run 100 times and get the average regression error
+        # Run 1000 times and get the average regression error
         iterations = 1000
-        cumulativeError = 0.0
-        for i in range(iterations):
-            inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.ClassicReservoirTopology(size=size).generateWeightMatrix()
-
-            error = trainAndGetError(size=size,
-                                     spectralRadius=spectralRadius,
-                                     inputScaling=inputScaling,
-                                     reservoirScaling=reservoirScaling,
-                                     leakingRate=leakingRate,
-                                     initialTransient=initialTransient,
-                                     trainingInputData=trainingInputData,
-                                     trainingOutputData=trainingOutputData,
-                                     inputWeightMatrix=inputWeightMatrix,
-                                     reservoirWeightMatrix=reservoirWeightMatrix,
-                                     validationOutputData=validationOutputData,
-                                     horizon=horizon,
-                                     testingActualOutputData=testingActualOutputData)
-
-            # Calculate the error
-            cumulativeError += error
-
-        return cumulativeError/iterations, optimalParameters
+        error = averageEnsembleError(iterations,
+                                     lambda: (topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix(),
+                                              topology.ClassicReservoirTopology(size=size).generateWeightMatrix()),
+                                     **errorArgs)
+
+        return error, optimalParameters
 
     elif(resTopology == Topology.Random):
         resTuner = tuner.RandomConnectivityBruteTuner(size=size,
@@ -330,37 +337,21 @@ def tuneConnectivity(trainingInputData, trainingOutputData, validationOutputData
                                                  initialSeed=initialInputSeedForValidation,
                                                  validationOutputData=validationOutputData,
                                                  spectralRadius=spectralRadius, inputScaling=inputScaling,
-                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate)
+                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                                                 minimizer=minimizer)
         reservoirConnectivityOptimum = resTuner.getOptimalParameters()
 
 
         optimalParameters["Optimal_Reservoir_Connectivity"] = reservoirConnectivityOptimum
 
-        # Run 100 times and get the average regression error
+        # Run 1000 times and get the average regression error
         iterations = 1000
-        cumulativeError = 0.0
-        for i in range(iterations):
-            inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.RandomReservoirTopology(size=size, connectivity=reservoirConnectivityOptimum).generateWeightMatrix()
-
-            error = trainAndGetError(size=size,
-                                     spectralRadius=spectralRadius,
-                                     inputScaling=inputScaling,
-                                     reservoirScaling=reservoirScaling,
-                                     leakingRate=leakingRate,
-                                     initialTransient=initialTransient,
-                                     trainingInputData=trainingInputData,
-                                     trainingOutputData=trainingOutputData,
-                                     inputWeightMatrix=inputWeightMatrix,
-                                     reservoirWeightMatrix=reservoirWeightMatrix,
-                                     validationOutputData=validationOutputData,
-                                     horizon=horizon,
-                                     testingActualOutputData=testingActualOutputData)
-
-            # Calculate the error
-            cumulativeError += error
-
-        return cumulativeError/iterations, optimalParameters
+        error = averageEnsembleError(iterations,
+                                     lambda: (topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix(),
+                                              topology.RandomReservoirTopology(size=size, connectivity=reservoirConnectivityOptimum).generateWeightMatrix()),
+                                     **errorArgs)
+
+        return error, optimalParameters
 
     elif(resTopology == Topology.ErdosRenyi):
         resTuner = tuner.ErdosRenyiConnectivityBruteTuner(size=size,
@@ -370,36 +361,20 @@ def tuneConnectivity(trainingInputData, trainingOutputData, validationOutputData
                                                  initialSeed=initialInputSeedForValidation,
                                                  validationOutputData=validationOutputData,
                                                  spectralRadius=spectralRadius, inputScaling=inputScaling,
-                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate)
+                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                                                 minimizer=minimizer)
         probabilityOptimum = resTuner.getOptimalParameters()
 
         optimalParameters["Optimal_Connectivity_Probability"] = probabilityOptimum
 
-        # Run 100 times and get the average regression error
+        # Run 1000 times and get the average regression error
         iterations = 1000
-        cumulativeError = 0.0
-        for i in range(iterations):
-            inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.ErdosRenyiTopology(size=size, probability=probabilityOptimum).generateWeightMatrix()
-
-            error = trainAndGetError(size=size,
-                                     spectralRadius=spectralRadius,
-                                     inputScaling=inputScaling,
-                                     reservoirScaling=reservoirScaling,
-                                     leakingRate=leakingRate,
-                                     initialTransient=initialTransient,
-                                     trainingInputData=trainingInputData,
-                                     trainingOutputData=trainingOutputData,
-                                     inputWeightMatrix=inputWeightMatrix,
-                                     reservoirWeightMatrix=reservoirWeightMatrix,
-                                     validationOutputData=validationOutputData,
-                                     horizon=horizon,
-                                     testingActualOutputData=testingActualOutputData)
-
-            # Calculate the error
-            cumulativeError += error
-
-        return cumulativeError/iterations, optimalParameters
+        error = averageEnsembleError(iterations,
+                                     lambda: (topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix(),
+                                              topology.ErdosRenyiTopology(size=size, probability=probabilityOptimum).generateWeightMatrix()),
+                                     **errorArgs)
+
+        return error, optimalParameters
 
     elif(resTopology == Topology.ScaleFreeNetworks):
         resTuner = tuner.ScaleFreeNetworksConnectivityBruteTuner(size=size,
@@ -409,36 +384,20 @@ def tuneConnectivity(trainingInputData, trainingOutputData, validationOutputData
                                                  initialSeed=initialInputSeedForValidation,
                                                  validationOutputData=validationOutputData,
                                                  spectralRadius=spectralRadius, inputScaling=inputScaling,
-                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate)
+                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                                                 minimizer=minimizer)
         attachmentOptimum = resTuner.getOptimalParameters()
 
         optimalParameters["Optimal_Preferential_Attachment"] = attachmentOptimum
 
-        # Run 100 times and get the average regression error
+        # Run 1000 times and get the average regression error
         iterations = 1000
-        cumulativeError = 0.0
-        for i in range(iterations):
-            inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.ScaleFreeNetworks(size=size, attachmentCount=attachmentOptimum).generateWeightMatrix()
-
-            error = trainAndGetError(size=size,
-                                     spectralRadius=spectralRadius,
-                                     inputScaling=inputScaling,
-                                     reservoirScaling=reservoirScaling,
-                                     leakingRate=leakingRate,
-                                     initialTransient=initialTransient,
-                                     trainingInputData=trainingInputData,
-                                     trainingOutputData=trainingOutputData,
-                                     inputWeightMatrix=inputWeightMatrix,
-                                     reservoirWeightMatrix=reservoirWeightMatrix,
-                                     validationOutputData=validationOutputData,
-                                     horizon=horizon,
-                                     testingActualOutputData=testingActualOutputData)
-
-            # Calculate the error
-            cumulativeError += error
-
-        return cumulativeError/iterations, optimalParameters
+        error = averageEnsembleError(iterations,
+                                     lambda: (topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix(),
+                                              topology.ScaleFreeNetworks(size=size, attachmentCount=attachmentOptimum).generateWeightMatrix()),
+                                     **errorArgs)
+
+        return error, optimalParameters
 
     elif(resTopology == Topology.SmallWorldGraphs):
         resTuner = tuner.SmallWorldGraphsConnectivityBruteTuner(size=size,
@@ -448,43 +407,58 @@ def tuneConnectivity(trainingInputData, trainingOutputData, validationOutputData
                                                  initialSeed=initialInputSeedForValidation,
                                                  validationOutputData=validationOutputData,
                                                  spectralRadius=spectralRadius, inputScaling=inputScaling,
-                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate)
+                                                 reservoirScaling=reservoirScaling, leakingRate=leakingRate,
+                                                 minimizer=minimizer)
         meanDegreeOptimum, betaOptimum  = resTuner.getOptimalParameters()
 
         optimalParameters["Optimal_MeanDegree"] = meanDegreeOptimum
         optimalParameters["Optimal_Beta"] = betaOptimum
 
-        # Run 100 times and get the average regression error
+        # Run 1000 times and get the average regression error
         iterations = 1000
-        cumulativeError = 0.0
-        for i in range(iterations):
-            inputWeightMatrix = topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix()
-            reservoirWeightMatrix = topology.SmallWorldGraphs(size=size, meanDegree=int(meanDegreeOptimum), beta=betaOptimum).generateWeightMatrix()
-
-            error = trainAndGetError(size=size,
-                                     spectralRadius=spectralRadius,
-                                     inputScaling=inputScaling,
-                                     reservoirScaling=reservoirScaling,
-                                     leakingRate=leakingRate,
-                                     initialTransient=initialTransient,
-                                     trainingInputData=trainingInputData,
-                                     trainingOutputData=trainingOutputData,
-                                     inputWeightMatrix=inputWeightMatrix,
-                                     reservoirWeightMatrix=reservoirWeightMatrix,
-                                     validationOutputData=validationOutputData,
-                                     horizon=horizon,
-                                     testingActualOutputData=testingActualOutputData)
-
-            # Calculate the error
-            cumulativeError += error
-
-        return cumulativeError/iterations, optimalParameters
+        error = averageEnsembleError(iterations,
+                                     lambda: (topology.ClassicInputTopology(inputSize=trainingInputData.shape[1], reservoirSize=size).generateWeightMatrix(),
+                                              topology.SmallWorldGraphs(size=size, meanDegree=int(meanDegreeOptimum), beta=betaOptimum).generateWeightMatrix()),
+                                     **errorArgs)
+
+        return error, optimalParameters
+
+# Errors of trained configurations - with given weight matrices trainAndGetError is deterministic, so an identical
+# configuration is trained only once. errorCache.invalidate() drops the stored errors.
+errorCache = cache.LRUCache(maxSize=128)
 
 def trainAndGetError(size, spectralRadius, inputScaling, reservoirScaling, leakingRate,
                      initialTransient, trainingInputData, trainingOutputData,
                      inputWeightMatrix, reservoirWeightMatrix,
                      validationOutputData, horizon, testingActualOutputData):
 
+    # Without weight matrices every call draws new random weights, so only the given ones are memoised
+    if inputWeightMatrix is None or reservoirWeightMatrix is None:
+        return _trainAndGetError(size, spectralRadius, inputScaling, reservoirScaling, leakingRate,
+                                 initialTransient, trainingInputData, trainingOutputData,
+                                 inputWeightMatrix, reservoirWeightMatrix,
+                                 validationOutputData, horizon, testingActualOutputData)
+
+    key = cache.fingerprint(int(size), float(spectralRadius), float(inputScaling), float(reservoirScaling),
+                            float(leakingRate), int(initialTransient), int(horizon),
+                            np.asarray(trainingInputData), np.asarray(trainingOutputData),
+                            np.asarray(inputWeightMatrix),
+                            reservoirWeightMatrix if sparse.issparse(reservoirWeightMatrix) else np.asarray(reservoirWeightMatrix),
+                            np.asarray(validationOutputData), np.asarray(testingActualOutputData))
+    error = errorCache.get(key)
+    if error is None:
+        error = _trainAndGetError(size, spectralRadius, inputScaling, reservoirScaling, leakingRate,
+                                  initialTransient, trainingInputData, trainingOutputData,
+                                  inputWeightMatrix, reservoirWeightMatrix,
+                                  validationOutputData, horizon, testingActualOutputData)
+        errorCache.put(key, error)
+    return error
+
+def _trainAndGetError(size, spectralRadius, inputScaling, reservoirScaling, leakingRate,
+                      initialTransient, trainingInputData, trainingOutputData,
+                      inputWeightMatrix, reservoirWeightMatrix,
+                      validationOutputData, horizon, testingActualOutputData):
+
     # Error function
     errorFun = metrics.MeanSquareError()
 
@@ -510,4 +484,55 @@ def trainAndGetError(size, spectralRadius, inputScaling, reservoirScaling, leaki
 
     # Calculate the error
     error = errorFun.compute(testingActualOutputData, predictedOutputData)
-    return error
\ No newline at end of file
+    return error
+
+def trainAndGetEnsembleErrors(size, spectralRadius, inputScaling, reservoirScaling, leakingRate,
+                              initialTransient, trainingInputData, trainingOutputData,
+                              inputWeightMatrices, reservoirWeightMatrices,
+                              warmupInputData, seed, horizon, actualOutputData, dtype=np.float64):
+
+    # Train all the members of the ensemble together
+    network = ensembleESN.Reservoir(size=size,
+                                    spectralRadius=spectralRadius,
+                                    inputScaling=inputScaling,
+                                    reservoirScaling=reservoirScaling,
+                                    leakingRate=leakingRate,
+                                    initialTransient=initialTransient,
+                                    inputData=trainingInputData,
+                                    outputData=trainingOutputData,
+                                    inputWeightRandom=inputWeightMatrices,
+                                    reservoirWeightRandom=reservoirWeightMatrices,
+                                    dtype=dtype)
+    network.trainReservoir()
+
+    # Warm up
+    with trace.phase("warmup"):
+        network.predict(warmupInputData)
+
+    # Closed-loop forecast of all the members - K X horizon X Ny
+    with trace.phase("forecast"):
+        predictedOutputData = network.predictFuture(seed, horizon)
+
+    # Mean square error of each member
+    actualOutputData = np.asarray(actualOutputData).reshape((horizon, -1))
+    return np.mean((predictedOutputData - actualOutputData) ** 2, axis=(1, 2))
+
+def averageEnsembleError(times, generateWeightMatrices, ensembleSize=10, **errorArgs):
+    """
+    Average error of 'times' reservoirs, trained 'ensembleSize' at a time - the memory of a batch grows with
+    ensembleSize X Nx X Nx (the weight matrices of the members are stacked several times)
+    :param generateWeightMatrices: draws one (input weight matrix, reservoir weight matrix) pair
+    :param errorArgs: the remaining arguments of trainAndGetEnsembleErrors
+    """
+    cumulativeError = 0.0
+    remaining = times
+    while remaining > 0:
+        count = min(ensembleSize, remaining)
+        with trace.phase("topology"):
+            weightMatrices = [generateWeightMatrices() for i in range(count)]
+        errors = trainAndGetEnsembleErrors(inputWeightMatrices=np.array([w[0] for w in weightMatrices]),
+                                           reservoirWeightMatrices=np.array([w[1] for w in weightMatrices]),
+                                           **errorArgs)
+        cumulativeError += np.sum(errors)
+        remaining -= count
+    return cumulativeError / times
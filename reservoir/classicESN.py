@@ -1,17 +1,38 @@
 import numpy as np
-import scipy.linalg as la
-import scipy.sparse.linalg as sla
+import scipy.sparse as sparse
 from scipy.special import expit
 from enum import Enum
-from reservoir import ActivationFunctions as act
+from reservoir import ActivationFunctions as act, SpectralRadius as radius, Cache as cache, Readout as readout, Kernel as kernel, JITKernel as jit
+from reservoir import Trace as trace
 
 def _npRelu(np_features):
     return np.maximum(np_features, np.zeros(np_features.shape))
 
+class Feedback(object):
+    def __init__(self, inputColumns, outputColumns=None, lags=None):
+        """
+        Tells Reservoir.generate which outputs are fed back into which input columns. The input columns not listed here
+        (eg. the bias) keep the values of the seed input.
+
+        :param inputColumns: input columns which receive the outputs
+        :param outputColumns: output fed into each of the input columns - defaults to the first output
+        :param lags: how many steps back the output is taken from - 1 (the default) is the latest output
+        """
+        self.inputColumns = np.asarray(inputColumns, dtype=int)
+        if(outputColumns is None):
+            outputColumns = np.zeros(self.inputColumns.shape[0], dtype=int)
+        if(lags is None):
+            lags = np.ones(self.inputColumns.shape[0], dtype=int)
+        self.outputColumns = np.asarray(outputColumns, dtype=int)
+        self.lags = np.asarray(lags, dtype=int)
+
 class Reservoir:
     def __init__(self, size, spectralRadius, inputScaling, reservoirScaling, leakingRate, initialTransient,
                  inputData, outputData, inputWeightRandom = None, reservoirWeightRandom = None,
-                 reservoirActivationFunction=act.HyperbolicTangent(), outputActivationFunction=act.Linear()):
+                 reservoirActivationFunction=act.HyperbolicTangent(), outputActivationFunction=act.Linear(),
+                 sparseReservoir=False, spectralRadiusEstimator=None, regularization=1e-2,
+                 chunkSize=None, dtype=np.float64, accumulationDtype=np.float64, backend=kernel.Backend.NumPy,
+                 inputProjection=None, unitReservoirWeight=None):
         """
         :param Nx: size of the reservoir
         :param spectralRadius: spectral radius for reservoir weight matrix
@@ -19,6 +40,26 @@ class Reservoir:
                                 1 X D - For each parameter
         :param leakingRate: leaking rate of the reservoir
         :param data: input data (N X D)
+        :param sparseReservoir: keep the reservoir weight matrix in CSR format - the recurrence then costs O(nnz) per step
+                                (use it for the sparse topologies - Random, ErdosRenyi, SmallWorld and ScaleFree)
+        :param spectralRadiusEstimator: one of the estimators in SpectralRadius - defaults to the dense eigen solver,
+                                        or to Arnoldi for a sparse reservoir. The radius is memoised per random matrix
+                                        and reservoir scaling.
+        :param regularization: ridge regularization of the readout (added to the diagonal of the state Gram matrix)
+                               - see RidgeReadout for the choice of the default
+        :param chunkSize: when given, the states are harvested in chunks of chunkSize and added to the readout
+                          accumulators - the full state matrix (internalState) is never stored, so the memory is
+                          O(Nx^2) irrespective of the length of the data
+        :param dtype: precision of the weights and states - np.float32 halves the memory traffic of the recurrence
+        :param accumulationDtype: precision of the readout Gram accumulation and solve (float64 keeps the readout
+                                  accurate even when the states are float32)
+        :param backend: kernel.Backend.JIT compiles the recurrence and the one step prediction with Numba - worth it
+                        for small reservoirs, where the per step Python overhead dominates. Falls back to NumPy when
+                        Numba is not installed or the activation functions are not supported.
+        :param inputProjection: optional precomputed projection W_in u(t) of the training input data (N X Nx) - used
+                                instead of the input weight during training (see EnhancedClassicTuner)
+        :param unitReservoirWeight: optional reservoir weight matrix already scaled and normalised to a unit spectral
+                                    radius - only the spectral radius is applied, reservoirWeightRandom is not needed
         """
         self.Nx = size
         self.spectralRadius = spectralRadius
@@ -28,32 +69,53 @@ class Reservoir:
         self.initialTransient = initialTransient
         self.inputData = inputData
         self.outputData = outputData
+        self.regularization = regularization
+        self.chunkSize = chunkSize
+        self.dtype = dtype
+        self.accumulationDtype = accumulationDtype
+        self.backend = backend
+        self.inputProjection = inputProjection
+        self.sparseReservoir = sparseReservoir
+        if(spectralRadiusEstimator is None):
+            spectralRadiusEstimator = radius.Arnoldi() if sparseReservoir else radius.EigenValues()
+        self.spectralRadiusEstimator = spectralRadiusEstimator
 
         # Initialize weights
         self.inputN, self.inputD = self.inputData.shape
         self.outputN, self.outputD = self.outputData.shape
         self.Nu = self.inputD
         self.Ny = self.outputD
-        self.inputWeight = np.zeros((self.Nx, self.Nu))
-        self.reservoirWeight = np.zeros((self.Nx, self.Nx))
-        self.outputWeight = np.zeros((self.Ny, self.Nx))
+        self.inputWeight = np.zeros((self.Nx, self.Nu), dtype=self.dtype)
+        self.reservoirWeight = np.zeros((self.Nx, self.Nx), dtype=self.dtype)
+        self.outputWeight = np.zeros((self.Ny, self.Nx), dtype=self.dtype)
 
         if(inputWeightRandom is None):
-            self.inputWeightRandom = np.random.rand(self.Nx, self.Nu)
+            self.inputWeightRandom = np.random.rand(self.Nx, self.Nu).astype(self.dtype)
         else:
-            self.inputWeightRandom = np.copy(inputWeightRandom)
-        if(reservoirWeightRandom is None):
-            self.reservoirWeightRandom = np.random.rand(self.Nx, self.Nx)
+            self.inputWeightRandom = np.array(inputWeightRandom, dtype=self.dtype)
+        if(unitReservoirWeight is not None):
+            self.reservoirWeightRandom = None
+        elif(reservoirWeightRandom is None):
+            self.reservoirWeightRandom = np.random.rand(self.Nx, self.Nx).astype(self.dtype)
+        elif(self.sparseReservoir):
+            # Not mutated in the sparse case, so no need for a dense copy
+            self.reservoirWeightRandom = reservoirWeightRandom
         else:
-            self.reservoirWeightRandom = np.copy(reservoirWeightRandom)
+            self.reservoirWeightRandom = np.array(reservoirWeightRandom, dtype=self.dtype)
 
         # Generate the input and reservoir weights
         self.__generateInputWeight()
-        self.__generateReservoirWeight()
+        if(unitReservoirWeight is None):
+            self.__generateReservoirWeight()
+        else:
+            self.reservoirWeight = unitReservoirWeight * float(self.spectralRadius)
 
-        # Internal states
-        self.internalState = np.zeros((self.inputN-self.initialTransient, self.Nx))
-        self.latestInternalState = np.zeros(self.Nx)
+        # Internal states - not stored when streaming
+        if(self.chunkSize is None):
+            self.internalState = np.zeros((self.inputN-self.initialTransient, self.Nx), dtype=self.dtype)
+        else:
+            self.internalState = None
+        self.latestInternalState = np.zeros(self.Nx, dtype=self.dtype)
 
         # Activation functions
         self.reservoirActivation = reservoirActivationFunction
@@ -69,6 +131,13 @@ class Reservoir:
         self.inputWeight[self.inputWeight!=0.0] = self.inputWeight[self.inputWeight!=0.0] - self.inputScaling
 
     def __generateReservoirWeight(self):
+        if(self.sparseReservoir):
+            self.__generateSparseReservoirWeight()
+            return
+
+        # The random matrix is scaled in place below, so take its fingerprint first
+        weightFingerprint = cache.fingerprint(self.reservoirWeightRandom)
+
         # Choose a uniform distribution
         self.reservoirWeight = self.reservoirWeightRandom
 
@@ -76,65 +145,147 @@ class Reservoir:
         self.reservoirWeight[self.reservoirWeight!=0.0] = self.reservoirWeight[self.reservoirWeight!=0.0] - self.reservoirScaling
 
         # Make the reservoir weight matrix - a unit spectral radius
-        rad = np.max(np.abs(la.eigvals(self.reservoirWeight)))
-        self.reservoirWeight = self.reservoirWeight / rad
+        with trace.phase("spectral"):
+            rad = radius.cachedSpectralRadius(self.reservoirWeight, weightFingerprint, self.reservoirScaling, self.spectralRadiusEstimator)
+        self.reservoirWeight /= float(rad)
 
         # Force spectral radius
-        self.reservoirWeight = self.reservoirWeight * self.spectralRadius
+        self.reservoirWeight *= self.spectralRadius
 
-    # TODO: This is a candidate for gnumpy conversion
-    def trainReservoir(self):
+    def __generateSparseReservoirWeight(self):
+        # Only the non-zero elements are stored, so the scaling is applied on the data array directly
+        self.reservoirWeight = sparse.csr_matrix(self.reservoirWeightRandom, dtype=self.dtype)
+        self.reservoirWeight.data -= self.reservoirScaling
 
-        internalState = np.zeros(self.Nx)
+        # Make the reservoir weight matrix - a unit spectral radius
+        weightFingerprint = cache.fingerprint(self.reservoirWeightRandom)
+        with trace.phase("spectral"):
+            rad = radius.cachedSpectralRadius(self.reservoirWeight, weightFingerprint, self.reservoirScaling, self.spectralRadiusEstimator)
+        self.reservoirWeight = self.reservoirWeight * float(self.spectralRadius / rad)
 
-        # Compute internal states of the reservoir
-        for t in range(self.inputN):
-            term1 = np.dot(self.inputWeight,self.inputData[t])
-            term2 = np.dot(self.reservoirWeight,internalState)
-            internalState = (1.0-self.leakingRate)*internalState + self.leakingRate*self.reservoirActivation(term1 + term2)
-            if t >= self.initialTransient:
-                self.internalState[t-self.initialTransient] = internalState
+    def __harvestStates(self, inputData, initialState, states=None, projection=None):
+        return kernel.harvestStates(inputData, self.inputWeight, self.reservoirWeight, self.leakingRate,
+                                    self.reservoirActivation, initialState, states, self.backend, projection)
 
-        # Learn the output weights
-        A = self.internalState
-        B = self.outputData[self.initialTransient:, :]
+    def __trainingProjection(self, start, stop):
+        if(self.inputProjection is None):
+            return None
+        return self.inputProjection[start:stop]
 
-        # Solve for x in Ax = B
-        for d in range(self.outputD):
-            B = self.outputData[self.initialTransient:, d]
-            self.outputWeight[d, :] = sla.lsmr(A, B, damp=1e-8)[0]
+    def trainReservoir(self):
 
-    # TODO: This is a candidate for gnumpy conversion
-    def predict(self, testInputData):
+        ridge = readout.RidgeReadout(self.Nx, self.Ny, self.regularization, self.accumulationDtype)
 
-        testInputN, testInputD = testInputData.shape
-        statesN, resD = self.internalState.shape
+        # Wash out the initial transient
+        with trace.phase("harvest"):
+            internalState = self.__harvestStates(self.inputData[:self.initialTransient], np.zeros(self.Nx, dtype=self.dtype),
+                                                 projection=self.__trainingProjection(0, self.initialTransient))
 
-        internalState = self.latestInternalState
+        # Compute internal states of the reservoir - either into the state matrix, or when streaming,
+        # chunk by chunk into a buffer which is added to the readout
+        if(self.chunkSize is None):
+            with trace.phase("harvest"):
+                self.__harvestStates(self.inputData[self.initialTransient:], internalState, self.internalState,
+                                     self.__trainingProjection(self.initialTransient, self.inputN))
+            with trace.phase("readout"):
+                ridge.accumulate(self.internalState, self.outputData[self.initialTransient:, :])
+        else:
+            states = np.zeros((self.chunkSize, self.Nx), dtype=self.dtype)
+            for start in range(self.initialTransient, self.inputN, self.chunkSize):
+                stop = min(start + self.chunkSize, self.inputN)
+                with trace.phase("harvest"):
+                    internalState = self.__harvestStates(self.inputData[start:stop], internalState, states[:stop-start],
+                                                         self.__trainingProjection(start, stop))
+                with trace.phase("readout"):
+                    ridge.accumulate(states[:stop-start], self.outputData[start:stop, :])
 
-        testOutputData = np.zeros((testInputN, self.outputD))
+        # Learn the output weights - all the outputs are solved together
+        with trace.phase("readout"):
+            self.outputWeight = ridge.solve().astype(self.dtype)
 
-        for t in range(testInputN):
-            # Reservoir activation
-            term1 = np.dot(self.inputWeight,testInputData[t])
-            term2 = np.dot(self.reservoirWeight,internalState)
-            internalState = (1-self.leakingRate)*internalState + self.leakingRate*self.reservoirActivation(term1 + term2)
+    def predict(self, testInputData):
 
-            # Output
-            output = self.outputActivation(np.dot(self.outputWeight, internalState))
-            testOutputData[t, :] = output
+        testInputN, testInputD = testInputData.shape
+        states = np.zeros((testInputN, self.Nx), dtype=self.dtype)
 
         # This is to preserve the internal state between multiple predict calls
-        self.latestInternalState = internalState
+        self.latestInternalState = self.__harvestStates(testInputData, self.latestInternalState, states)
+
+        # Output
+        testOutputData = self.outputActivation(np.dot(states, self.outputWeight.T))
 
         return testOutputData
-    
-    # TODO: This is a candidate for gnumpy conversion
+
     def predictOnePoint(self, testInput):
-        term1 = np.dot(self.inputWeight,testInput[0])
-        term2 = np.dot(self.reservoirWeight,self.latestInternalState)
-        self.latestInternalState = (1-self.leakingRate)*self.latestInternalState + self.leakingRate*self.reservoirActivation(term1 + term2)
+        if(kernel.useJIT(self.backend, self.reservoirActivation, self.outputActivation)):
+            output, self.latestInternalState = jit.predictOnePoint(testInput[0], self.inputWeight, self.reservoirWeight,
+                                                                   self.outputWeight, self.leakingRate, self.reservoirActivation,
+                                                                   self.outputActivation, self.latestInternalState)
+            return output
+
+        self.latestInternalState = self.__harvestStates(testInput[:1], self.latestInternalState)
 
         # Output - Non-linearity applied through activation function
         output = self.outputActivation(np.dot(self.outputWeight, self.latestInternalState))
-        return output
\ No newline at end of file
+        return output
+
+    def predictBatch(self, testInputData, initialStates=None):
+        """
+        Predicts B sequences with the trained reservoir - all of them are advanced together, one matmul per time step.
+        latestInternalState is not touched.
+
+        :param testInputData: B X T X D
+        :param initialStates: B X Nx - defaults to latestInternalState for every sequence
+        :return: outputs (B X T X Ny), final states (B X Nx)
+        """
+        batchSize, testInputN, testInputD = testInputData.shape
+        if(initialStates is None):
+            initialStates = np.tile(self.latestInternalState, (batchSize, 1))
+        states = np.zeros((batchSize, testInputN, self.Nx), dtype=self.dtype)
+
+        finalStates = kernel.harvestBatchStates(testInputData, self.inputWeight, self.reservoirWeight, self.leakingRate,
+                                                self.reservoirActivation, initialStates, states)
+
+        # Output
+        testOutputData = self.outputActivation(np.dot(states, self.outputWeight.T))
+
+        return testOutputData, finalStates
+
+    def predictOnePointBatch(self, testInputs, states):
+        """
+        :param testInputs: B X D - one input for each sequence
+        :param states: B X Nx - current state of each sequence
+        :return: outputs (B X Ny), states after the step (B X Nx)
+        """
+        outputs, finalStates = self.predictBatch(testInputs[:, None, :], states)
+        return outputs[:, 0, :], finalStates
+
+    def generate(self, horizon, seedInput, feedback=None, history=None):
+        """
+        Closed-loop prediction - runs the reservoir for horizon steps from latestInternalState, feeding its own outputs
+        back as inputs. latestInternalState is updated, as with predict.
+
+        :param horizon: number of steps to generate
+        :param seedInput: D input of the first step
+        :param feedback: a Feedback - defaults to the latest output fed into the last input column, ie. the
+                         [1.0, last output] layout of Utility.formFeatureVectors
+        :param history: optional L X Ny known outputs before the seed (oldest first) - used by the lagged feedback
+                        until enough outputs are generated. Without it the lagged columns keep the seed values.
+        :return: horizon X Ny
+        """
+        if(feedback is None):
+            feedback = Feedback([self.inputD - 1])
+        if(history is None):
+            history = np.zeros((0, self.Ny))
+        historyLength = history.shape[0]
+
+        # Known outputs followed by the generated ones, so that the lagged outputs are a plain row lookup
+        trajectory = np.zeros((historyLength + horizon, self.Ny), dtype=self.dtype)
+        trajectory[:historyLength] = history
+
+        self.latestInternalState = kernel.generate(np.ravel(seedInput), self.inputWeight, self.reservoirWeight,
+                                                   self.outputWeight, self.leakingRate, self.reservoirActivation,
+                                                   self.outputActivation, self.latestInternalState,
+                                                   feedback.inputColumns, feedback.outputColumns, feedback.lags,
+                                                   trajectory, historyLength, self.backend)
+        return trajectory[historyLength:]
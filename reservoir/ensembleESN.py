@@ -0,0 +1,162 @@
+import numpy as np
+from reservoir import ActivationFunctions as act, SpectralRadius as radius, Trace as trace
+
+class Reservoir:
+    def __init__(self, size, spectralRadius, inputScaling, reservoirScaling, leakingRate, initialTransient,
+                 inputData, outputData, inputWeightRandom = None, reservoirWeightRandom = None, ensembleSize = None,
+                 reservoirActivationFunction=act.HyperbolicTangent(), outputActivationFunction=act.Linear(),
+                 spectralRadiusEstimator=radius.EigenValues(), regularization=1e-2, chunkSize=256,
+                 dtype=np.float64, accumulationDtype=np.float64):
+        """
+        An ensemble of K independent classic reservoirs sharing the same parameters and training data. The weights
+        are kept as stacked arrays, so all K states are advanced with a single batched matmul per time step.
+
+        :param Nx: size of each reservoir
+        :param spectralRadius: spectral radius for reservoir weight matrix
+        :param inputScaling: scaling for input weight matrix - the values are chosen from [-inputScaling, +inputScaling]
+        :param leakingRate: leaking rate of the reservoir
+        :param inputWeightRandom: stacked random input matrices (K X Nx X D)
+        :param reservoirWeightRandom: stacked random reservoir matrices (K X Nx X Nx)
+        :param ensembleSize: K - only needed when the random matrices are not given
+        :param regularization: ridge regularization added to the diagonal of the state Gram matrix (as in
+                               classicESN - see RidgeReadout)
+        :param chunkSize: number of time steps harvested before they are added to the Gram matrices
+        :param dtype: precision of the weights and states
+        :param accumulationDtype: precision of the Gram matrices and the readout solve
+        """
+        self.Nx = size
+        self.spectralRadius = spectralRadius
+        self.inputScaling = inputScaling
+        self.reservoirScaling = reservoirScaling
+        self.leakingRate = leakingRate
+        self.initialTransient = initialTransient
+        self.inputData = inputData
+        self.outputData = outputData
+        self.spectralRadiusEstimator = spectralRadiusEstimator
+        self.regularization = regularization
+        self.chunkSize = chunkSize
+        self.dtype = dtype
+        self.accumulationDtype = accumulationDtype
+
+        self.inputN, self.inputD = self.inputData.shape
+        self.outputN, self.outputD = self.outputData.shape
+        self.Nu = self.inputD
+        self.Ny = self.outputD
+
+        if(inputWeightRandom is None):
+            self.K = ensembleSize
+            self.inputWeightRandom = np.random.rand(self.K, self.Nx, self.Nu).astype(self.dtype)
+        else:
+            self.inputWeightRandom = np.asarray(inputWeightRandom, dtype=self.dtype)
+            self.K = self.inputWeightRandom.shape[0]
+        if(reservoirWeightRandom is None):
+            self.reservoirWeightRandom = np.random.rand(self.K, self.Nx, self.Nx).astype(self.dtype)
+        else:
+            self.reservoirWeightRandom = np.asarray(reservoirWeightRandom, dtype=self.dtype)
+
+        # Generate the input and reservoir weights
+        self.__generateInputWeight()
+        self.__generateReservoirWeight()
+        self.outputWeight = np.zeros((self.K, self.Ny, self.Nx), dtype=self.dtype)
+
+        # Internal states
+        self.latestInternalState = np.zeros((self.K, self.Nx), dtype=self.dtype)
+
+        # Activation functions
+        self.reservoirActivation = reservoirActivationFunction
+        self.outputActivation = outputActivationFunction
+
+    def __generateInputWeight(self):
+        # Apply scaling only non-zero elements (Because of various toplogies)
+        self.inputWeight = np.where(self.inputWeightRandom != 0.0, self.inputWeightRandom - self.inputScaling, 0.0).astype(self.dtype)
+
+    def __generateReservoirWeight(self):
+        # Apply scaling only non-zero elements (Because of various toplogies)
+        self.reservoirWeight = np.where(self.reservoirWeightRandom != 0.0, self.reservoirWeightRandom - self.reservoirScaling, 0.0).astype(self.dtype)
+
+        # Force the spectral radius of each member
+        with trace.phase("spectral"):
+            for k in range(self.K):
+                rad = self.spectralRadiusEstimator(self.reservoirWeight[k])
+                self.reservoirWeight[k] *= float(self.spectralRadius / rad)
+
+    def __step(self, internalState, inputProjection):
+        # internalState: K X Nx, inputProjection: K X Nx
+        term2 = np.matmul(self.reservoirWeight, internalState[:, :, None])[:, :, 0]
+        return (1.0-self.leakingRate)*internalState + self.leakingRate*self.reservoirActivation(inputProjection + term2)
+
+    def __output(self, internalState):
+        return self.outputActivation(np.matmul(self.outputWeight, internalState[:, :, None])[:, :, 0])
+
+    def __project(self, inputData):
+        # Input projection for all members: (T X D) or (K X T X D) -> K X T X Nx
+        return np.matmul(np.asarray(inputData, dtype=self.dtype), self.inputWeight.transpose(0, 2, 1))
+
+    def trainReservoir(self):
+
+        internalState = np.zeros((self.K, self.Nx), dtype=self.dtype)
+        gram = np.zeros((self.K, self.Nx, self.Nx), dtype=self.accumulationDtype)
+        cross = np.zeros((self.K, self.Nx, self.Ny), dtype=self.accumulationDtype)
+
+        # Harvest the states chunk by chunk and add them to the Gram matrices of all members at once
+        for start in range(0, self.inputN, self.chunkSize):
+            stop = min(start + self.chunkSize, self.inputN)
+            with trace.phase("harvest"):
+                projection = self.__project(self.inputData[start:stop])
+                states = np.empty((self.K, stop - start, self.Nx), dtype=self.dtype)
+                for t in range(stop - start):
+                    internalState = self.__step(internalState, projection[:, t])
+                    states[:, t] = internalState
+
+            first = max(self.initialTransient - start, 0)
+            if first < stop - start:
+                with trace.phase("readout"):
+                    X = states[:, first:].astype(self.accumulationDtype, copy=False)
+                    Y = np.asarray(self.outputData[start + first:stop], dtype=self.accumulationDtype)
+                    XT = X.transpose(0, 2, 1)
+                    gram += np.matmul(XT, X)
+                    cross += np.matmul(XT, Y)
+
+        # Solve the K ridge regressions together
+        with trace.phase("readout"):
+            gram += self.regularization * np.identity(self.Nx)
+            self.outputWeight = np.linalg.solve(gram, cross).transpose(0, 2, 1).astype(self.dtype)
+
+    def predict(self, testInputData):
+        """
+        :param testInputData: T X D (shared by all members) or K X T X D
+        :return: K X T X Ny
+        """
+        projection = self.__project(testInputData)
+        testInputN = projection.shape[1]
+
+        internalState = self.latestInternalState
+        testOutputData = np.zeros((self.K, testInputN, self.outputD), dtype=self.dtype)
+
+        for t in range(testInputN):
+            internalState = self.__step(internalState, projection[:, t])
+            testOutputData[:, t, :] = self.__output(internalState)
+
+        # This is to preserve the internal state between multiple predict calls
+        self.latestInternalState = internalState
+
+        return testOutputData
+
+    def predictFuture(self, seed, horizon):
+        """
+        Closed-loop forecast of all members, fed back as [1.0, last output] (see Utility.formFeatureVectors)
+        :return: K X horizon X Ny
+        """
+        lastAvailableData = np.full(self.K, float(np.ravel(seed)[0]), dtype=self.dtype)
+        query = np.ones((self.K, 2), dtype=self.dtype)
+        predictedOutputData = np.zeros((self.K, horizon, self.outputD), dtype=self.dtype)
+
+        for i in range(horizon):
+            query[:, 1] = lastAvailableData
+            projection = np.matmul(self.inputWeight, query[:, :, None])[:, :, 0]
+            self.latestInternalState = self.__step(self.latestInternalState, projection)
+            output = self.__output(self.latestInternalState)
+            predictedOutputData[:, i, :] = output
+            lastAvailableData = output[:, 0]
+
+        return predictedOutputData
@@ -1,8 +1,8 @@
 import numpy as np
 import scipy.linalg as la
 import scipy.sparse.linalg as sla
-from scipy.special import expit
 from enum import Enum
+from reservoir import ActivationFunctions as act, Kernel as kernel
 
 class ActivationFunction(Enum):
     TANH = 1
@@ -16,7 +16,7 @@ def _npRelu(np_features):
 class Reservoir:
     def __init__(self, size, spectralRadius, inputScaling, reservoirScaling, leakingRate, initialTransient,
                  inputData, outputData, inputWeightRandom = None, reservoirWeightRandom = None,
-                 activationFunction=ActivationFunction.TANH, outputRelu = False):
+                 activationFunction=ActivationFunction.TANH, outputRelu = False, dtype=np.float64):
         """
         :param Nx: size of the reservoir
         :param spectralRadius: spectral radius for reservoir weight matrix
@@ -24,6 +24,7 @@ class Reservoir:
                                 1 X D - For each parameter
         :param leakingRate: leaking rate of the reservoir
         :param data: input data (N X D)
+        :param dtype: precision of the input/reservoir weights and the states
         """
         self.Nx = size
         self.spectralRadius = spectralRadius
@@ -33,24 +34,25 @@ class Reservoir:
         self.initialTransient = initialTransient
         self.inputData = inputData
         self.outputData = outputData
+        self.dtype = dtype
 
         # Initialize weights
         self.inputN, self.inputD = self.inputData.shape
         self.outputN, self.outputD = self.outputData.shape
         self.Nu = self.inputD
         self.Ny = self.outputD
-        self.inputWeight = np.zeros((self.Nx, self.Nu))
-        self.reservoirWeight = np.zeros((self.Nx, self.Nx))
+        self.inputWeight = np.zeros((self.Nx, self.Nu), dtype=self.dtype)
+        self.reservoirWeight = np.zeros((self.Nx, self.Nx), dtype=self.dtype)
         self.outputWeight = np.zeros((self.Ny, (self.Nu + self.Nx)))
 
         if(inputWeightRandom is None):
-            self.inputWeightRandom = np.random.rand(self.Nx, self.Nu)
+            self.inputWeightRandom = np.random.rand(self.Nx, self.Nu).astype(self.dtype)
         else:
-            self.inputWeightRandom = np.copy(inputWeightRandom)
+            self.inputWeightRandom = np.array(inputWeightRandom, dtype=self.dtype)
         if(reservoirWeightRandom is None):
-            self.reservoirWeightRandom = np.random.rand(self.Nx, self.Nx)
+            self.reservoirWeightRandom = np.random.rand(self.Nx, self.Nx).astype(self.dtype)
         else:
-            self.reservoirWeightRandom = np.copy(reservoirWeightRandom)
+            self.reservoirWeightRandom = np.array(reservoirWeightRandom, dtype=self.dtype)
 
         # Output Relu
         self.relu = outputRelu
@@ -60,16 +62,16 @@ class Reservoir:
         self.__generateReservoirWeight()
 
         # Internal states
-        self.internalState = np.zeros((self.inputN-self.initialTransient, self.Nx))
-        self.latestInternalState = np.zeros(self.Nx)
+        self.internalState = np.zeros((self.inputN-self.initialTransient, self.Nx), dtype=self.dtype)
+        self.latestInternalState = np.zeros(self.Nx, dtype=self.dtype)
 
         # Activation Function
         if activationFunction == ActivationFunction.TANH:
-            self.activation = np.tanh
+            self.activation = act.HyperbolicTangent()
         elif activationFunction == ActivationFunction.EXPIT:
-            self.activation = expit
+            self.activation = act.LogisticFunction()
         elif activationFunction == ActivationFunction.ReLU:
-            self.activation = _npRelu
+            self.activation = act.ReLU()
 
 
     def __generateInputWeight(self):
@@ -89,10 +91,14 @@ class Reservoir:
 
         # Make the reservoir weight matrix - a unit spectral radius
         rad = np.max(np.abs(la.eigvals(self.reservoirWeight)))
-        self.reservoirWeight = self.reservoirWeight / rad
+        self.reservoirWeight /= float(rad)
 
         # Force spectral radius
-        self.reservoirWeight = self.reservoirWeight * self.spectralRadius
+        self.reservoirWeight *= self.spectralRadius
+
+    def __harvestStates(self, inputData, initialState, states=None):
+        return kernel.harvestStates(inputData, self.inputWeight, self.reservoirWeight, self.leakingRate,
+                                    self.activation, initialState, states)
 
     # TODO: This is a candidate for gnumpy conversion
     # This is where the output weights are adapted in an online fashion
@@ -108,20 +114,19 @@ class Reservoir:
         outputDataOnline = self.outputData[nBatch:]
         self.trainReservoirBatch(inputDataBatch, outputDataBatch)
 
-        # Start with already excited reservoir
-        x_n = self.latestInternalState
+        # Compute internal states of the reservoir, starting with already excited reservoir
+        # (they do not depend on the output weights)
+        onlineStates = np.zeros((nOnline, self.Nx), dtype=self.dtype)
+        self.__harvestStates(inputDataOnline, self.latestInternalState, onlineStates)
 
         # Adaptation Rate
         adaptationRate = 0.001
 
-        # Compute internal states of the reservoir
         for t in range(nOnline):
             # Input vector u[n]
             u_n = inputDataOnline[t]
             # Reservoir internal state
-            term1 = np.dot(self.inputWeight, u_n)
-            term2 = np.dot(self.reservoirWeight, x_n)
-            x_n = (1.0-self.leakingRate)*x_n + self.leakingRate*self.activation(term1 + term2)
+            x_n = onlineStates[t]
 
             # Expected output
             d_n = outputDataOnline[t]
@@ -145,16 +150,12 @@ class Reservoir:
 
         inputN = inputData.shape[0]
         self.internalState = np.zeros((inputN-self.initialTransient, self.Nx))
-        internalState = np.zeros(self.Nx)
 
         # Compute internal states of the reservoir
-        for t in range(inputN):
-            term1 = np.dot(self.inputWeight, inputData[t])
-            term2 = np.dot(self.reservoirWeight,internalState)
-            internalState = (1.0-self.leakingRate)*internalState + self.leakingRate*self.activation(term1 + term2)
-            if t >= self.initialTransient:
-                self.internalState[t-self.initialTransient] = internalState
-                self.latestInternalState = internalState
+        internalState = self.__harvestStates(inputData[:self.initialTransient], np.zeros(self.Nx))
+        internalState = self.__harvestStates(inputData[self.initialTransient:], internalState, self.internalState)
+        if inputN > self.initialTransient:
+            self.latestInternalState = internalState
 
         # Learn the output weights
         A = np.hstack((inputData[self.initialTransient:], self.internalState))
@@ -164,43 +165,28 @@ class Reservoir:
             B = outputData[self.initialTransient:, d]
             self.outputWeight[d, :] = sla.lsmr(A, B, damp=1e-8)[0]
 
-    # TODO: This is a candidate for gnumpy conversion
     def predict(self, testInputData):
 
         testInputN, testInputD = testInputData.shape
-        statesN, resD = self.internalState.shape
-
-        internalState = self.latestInternalState
-
-        testOutputData = np.zeros((testInputN, self.outputD))
-
-        for t in range(testInputN):
-            # Reservoir activation
-            term1 = np.dot(self.inputWeight,testInputData[t])
-            term2 = np.dot(self.reservoirWeight,internalState)
-            internalState = (1-self.leakingRate)*internalState + self.leakingRate*self.activation(term1 + term2)
-
-            # Output
-            output = np.dot(self.outputWeight, np.hstack((testInputData[t], internalState))) # TODO: update here
-            # Apply Relu to output
-            if(self.relu):
-                output = _npRelu(output)
-            testOutputData[t, :] = output
+        states = np.zeros((testInputN, self.Nx), dtype=self.dtype)
 
         # This is to preserve the internal state between multiple predict calls
-        self.latestInternalState = internalState
+        self.latestInternalState = self.__harvestStates(testInputData, self.latestInternalState, states)
+
+        # Output
+        testOutputData = np.dot(np.hstack((testInputData, states)), self.outputWeight.T)
+        # Apply Relu to output
+        if(self.relu):
+            testOutputData = _npRelu(testOutputData)
 
         return testOutputData
 
-    # TODO: This is a candidate for gnumpy conversion
     def predictOnePoint(self, testInput):
-        term1 = np.dot(self.inputWeight,testInput[0])
-        term2 = np.dot(self.reservoirWeight,self.latestInternalState)
-        self.latestInternalState = (1-self.leakingRate)*self.latestInternalState + self.leakingRate*self.activation(term1 + term2)
+        self.latestInternalState = self.__harvestStates(testInput[:1], self.latestInternalState)
 
         # Output - Non-linearity applied through activation function
         output = np.dot(self.outputWeight, np.hstack((testInput[0], self.latestInternalState)))
         # Apply Relu to output
         if(self.relu):
             output = _npRelu(output)
-        return output
\ No newline at end of file
+        return output
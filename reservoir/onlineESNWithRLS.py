@@ -1,8 +1,8 @@
 import numpy as np
 import scipy.linalg as la
 import scipy.sparse.linalg as sla
-from scipy.special import expit
 from enum import Enum
+from reservoir import ActivationFunctions as act, Kernel as kernel
 
 class ActivationFunction(Enum):
     TANH = 1
@@ -16,7 +16,7 @@ def _npRelu(np_features):
 class Reservoir:
     def __init__(self, size, spectralRadius, inputScaling, reservoirScaling, leakingRate, initialTransient,
                  inputData, outputData, batchLearnRatio = 0.95, regFactor = 0.001, forgettingParameter = 0.999, inputWeightRandom = None, reservoirWeightRandom = None,
-                 activationFunction=ActivationFunction.TANH, outputRelu = False):
+                 activationFunction=ActivationFunction.TANH, outputRelu = False, dtype=np.float64, accumulationDtype=np.float64):
         """
         :param Nx: size of the reservoir
         :param spectralRadius: spectral radius for reservoir weight matrix
@@ -24,6 +24,8 @@ class Reservoir:
                                 1 X D - For each parameter
         :param leakingRate: leaking rate of the reservoir
         :param data: input data (N X D)
+        :param dtype: precision of the input/reservoir weights and the states
+        :param accumulationDtype: precision of the error covariance and the output weights
         """
         self.Nx = size
         self.spectralRadius = spectralRadius
@@ -33,6 +35,8 @@ class Reservoir:
         self.initialTransient = initialTransient
         self.inputData = inputData
         self.outputData = outputData
+        self.dtype = dtype
+        self.accumulationDtype = accumulationDtype
         self.batchLearnRatio = batchLearnRatio
         self.regFactor = regFactor
         self.forgettingParameter = forgettingParameter
@@ -42,18 +46,18 @@ class Reservoir:
         self.outputN, self.outputD = self.outputData.shape
         self.Nu = self.inputD
         self.Ny = self.outputD
-        self.inputWeight = np.zeros((self.Nx, self.Nu))
-        self.reservoirWeight = np.zeros((self.Nx, self.Nx))
-        self.outputWeight = np.zeros((self.Nx, self.Ny))
+        self.inputWeight = np.zeros((self.Nx, self.Nu), dtype=self.dtype)
+        self.reservoirWeight = np.zeros((self.Nx, self.Nx), dtype=self.dtype)
+        self.outputWeight = np.zeros((self.Nx, self.Ny), dtype=self.accumulationDtype)
 
         if(inputWeightRandom is None):
-            self.inputWeightRandom = np.random.rand(self.Nx, self.Nu)
+            self.inputWeightRandom = np.random.rand(self.Nx, self.Nu).astype(self.dtype)
         else:
-            self.inputWeightRandom = np.copy(inputWeightRandom)
+            self.inputWeightRandom = np.array(inputWeightRandom, dtype=self.dtype)
         if(reservoirWeightRandom is None):
-            self.reservoirWeightRandom = np.random.rand(self.Nx, self.Nx)
+            self.reservoirWeightRandom = np.random.rand(self.Nx, self.Nx).astype(self.dtype)
         else:
-            self.reservoirWeightRandom = np.copy(reservoirWeightRandom)
+            self.reservoirWeightRandom = np.array(reservoirWeightRandom, dtype=self.dtype)
 
         # Output Relu
         self.relu = outputRelu
@@ -63,20 +67,20 @@ class Reservoir:
         self.__generateReservoirWeight()
 
         # Internal states
-        self.internalState = np.zeros((self.inputN-self.initialTransient, self.Nx))
-        self.latestInternalState = np.zeros(self.Nx)
+        self.internalState = np.zeros((self.inputN-self.initialTransient, self.Nx), dtype=self.dtype)
+        self.latestInternalState = np.zeros(self.Nx, dtype=self.dtype)
 
         # Activation Function
         if activationFunction == ActivationFunction.TANH:
-            self.activation = np.tanh
+            self.activation = act.HyperbolicTangent()
         elif activationFunction == ActivationFunction.EXPIT:
-            self.activation = expit
+            self.activation = act.LogisticFunction()
         elif activationFunction == ActivationFunction.ReLU:
-            self.activation = _npRelu
+            self.activation = act.ReLU()
 
         # Online Training related items
         a = np.random.random_integers(900000, 999999) # Large value
-        self.errorCovariance = a * np.identity(size)
+        self.errorCovariance = a * np.identity(size, dtype=self.accumulationDtype)
 
 
     def __generateInputWeight(self):
@@ -96,10 +100,14 @@ class Reservoir:
 
         # Make the reservoir weight matrix - a unit spectral radius
         rad = np.max(np.abs(la.eigvals(self.reservoirWeight)))
-        self.reservoirWeight = self.reservoirWeight / rad
+        self.reservoirWeight /= float(rad)
 
         # Force spectral radius
-        self.reservoirWeight = self.reservoirWeight * self.spectralRadius
+        self.reservoirWeight *= self.spectralRadius
+
+    def __harvestStates(self, inputData, initialState, states=None):
+        return kernel.harvestStates(inputData, self.inputWeight, self.reservoirWeight, self.leakingRate,
+                                    self.activation, initialState, states)
 
 
     def trainReservoir(self):
@@ -124,15 +132,11 @@ class Reservoir:
 
         # Collect the reservoir states
         inputN = inputData.shape[0]
-        internalStates = np.zeros((inputN-self.initialTransient, self.Nx))
-        internalState = np.zeros(self.Nx)
-        for t in range(inputN):
-            term1 = np.dot(self.inputWeight, inputData[t])
-            term2 = np.dot(self.reservoirWeight,internalState)
-            internalState = (1.0-self.leakingRate)*internalState + self.leakingRate*self.activation(term1 + term2)
-            if t >= self.initialTransient:
-                internalStates[t-self.initialTransient] = internalState
-                self.latestInternalState = internalState
+        internalStates = np.zeros((inputN-self.initialTransient, self.Nx), dtype=self.dtype)
+        internalState = self.__harvestStates(inputData[:self.initialTransient], np.zeros(self.Nx))
+        internalState = self.__harvestStates(inputData[self.initialTransient:], internalState, internalStates)
+        if inputN > self.initialTransient:
+            self.latestInternalState = internalState
 
         # # Solve for x in Ax = B
         # A = internalStates
@@ -141,7 +145,8 @@ class Reservoir:
         #     self.outputWeight[:, d] = sla.lsmr(A, B, damp=1e-8)[0]
 
         # Compute the error covariance matrix
-        self.errorCovariance = np.linalg.inv(np.dot(internalStates.T, internalStates) + self.regFactor * np.identity(self.Nx))
+        internalStates = internalStates.astype(self.accumulationDtype, copy=False)
+        self.errorCovariance = np.linalg.inv(np.dot(internalStates.T, internalStates) + self.regFactor * np.identity(self.Nx, dtype=self.accumulationDtype))
 
         # Compute the output weights
         self.outputWeight = np.dot(self.errorCovariance, np.dot(internalStates.T, outputData[self.initialTransient:]))
@@ -149,19 +154,17 @@ class Reservoir:
     # TODO: This is a candidate for gnumpy conversion
     def trainReservoirOnline(self, inputData, outputData):
 
-        internalState = self.latestInternalState
-
         inputN = inputData.shape[0]
 
-        # Compute internal states of the reservoir
+        # Compute internal states of the reservoir - they do not depend on the output weights
+        internalStates = np.zeros((inputN, self.Nx), dtype=self.dtype)
+        self.__harvestStates(inputData, self.latestInternalState, internalStates)
+
         for t in range(inputN):
             print("Processing.."+str(t))
-            term1 = np.dot(self.inputWeight,inputData[t])
-            term2 = np.dot(self.reservoirWeight,internalState)
-            internalState = (1.0-self.leakingRate)*internalState + self.leakingRate*self.activation(term1 + term2)
             if t >= self.initialTransient:
                 # Output
-                x = np.array(internalState).reshape((self.Nx),1)
+                x = internalStates[t].reshape((self.Nx),1).astype(self.accumulationDtype)
                 output = np.dot(self.outputWeight.T, x)
 
                 # Error
@@ -177,39 +180,24 @@ class Reservoir:
                 self.errorCovariance = (self.errorCovariance - np.dot(np.dot(innovationvector, x.T), self.errorCovariance)) / self.forgettingParameter
 
 
-    # TODO: This is a candidate for gnumpy conversion
     def predict(self, testInputData):
 
         testInputN, testInputD = testInputData.shape
-        statesN, resD = self.internalState.shape
-
-        internalState = self.latestInternalState
-
-        testOutputData = np.zeros((testInputN, self.outputD))
-
-        for t in range(testInputN):
-            # Reservoir activation
-            term1 = np.dot(self.inputWeight,testInputData[t])
-            term2 = np.dot(self.reservoirWeight,internalState)
-            internalState = (1-self.leakingRate)*internalState + self.leakingRate*self.activation(term1 + term2)
-
-            # Output
-            output = np.dot(self.outputWeight.T, internalState)
-            # Apply Relu to output
-            if(self.relu):
-                output = _npRelu(output)
-            testOutputData[t, :] = output
+        states = np.zeros((testInputN, self.Nx), dtype=self.dtype)
 
         # This is to preserve the internal state between multiple predict calls
-        self.latestInternalState = internalState
+        self.latestInternalState = self.__harvestStates(testInputData, self.latestInternalState, states)
+
+        # Output
+        testOutputData = np.dot(states, self.outputWeight)
+        # Apply Relu to output
+        if(self.relu):
+            testOutputData = _npRelu(testOutputData)
 
         return testOutputData
 
-    # TODO: This is a candidate for gnumpy conversion
     def predictOnePoint(self, testInput):
-        term1 = np.dot(self.inputWeight,testInput[0])
-        term2 = np.dot(self.reservoirWeight,self.latestInternalState)
-        self.latestInternalState = (1-self.leakingRate)*self.latestInternalState + self.leakingRate*self.activation(term1 + term2)
+        self.latestInternalState = self.__harvestStates(testInput[:1], self.latestInternalState)
 
         # Output - Non-linearity applied through activation function
         output = np.dot(self.outputWeight.T, self.latestInternalState)
@@ -43,9 +43,7 @@ for i in range(numberOfDays - 1):
     featureIndices.append(interval*i)
 featureIndices = np.array(featureIndices)
 
-featureVectors, targetVectors = util.formContinousFeatureAndTargetVectorsWithoutBias(trainingSeries, arbitraryDepth)
-featureVectors = featureVectors[:, featureIndices]
-featureVectors = np.hstack((np.ones((featureVectors.shape[0], 1)),featureVectors))
+featureVectors, targetVectors = util.formSelectedFeatureAndTargetVectors(trainingSeries, arbitraryDepth, featureIndices)
 
 
 
@@ -64,9 +64,6 @@ del filteredSeries
 # Step 5 - Split into training and testing
 trainingSeries, testingSeries = util.splitIntoTrainingAndTestingSeries(normalizedSeries, horizon)
 
-# Step 6 - Form the feature and target vectors for training
-trainingInputData, trainingOutputData = util.formContinousFeatureAndTargetVectorsWithoutBias(trainingSeries, arbitraryDepth)
-
 # Feature Indices
 featureIndicesList = []
 
@@ -74,6 +71,13 @@ featureIndicesList = []
 featureIndicesNetwork1 = np.arange(1, 60) * 24
 featureIndicesList.append(featureIndicesNetwork1)
 
+# Step 6 - Form the feature and target vectors for training - only the lags used by the constituent networks
+featureIndices = np.unique(np.concatenate(featureIndicesList))
+trainingInputData, trainingOutputData = util.formSelectedFeatureAndTargetVectors(trainingSeries, arbitraryDepth, featureIndices, bias=False)
+
+# Columns of each constituent network in the input data
+featureIndicesList = [np.searchsorted(featureIndices, indices) for indices in featureIndicesList]
+
 # Step 7 - Train the hierarchical echo state network
 hesn = hesni.HierarchicalESN(constituentNetworkParameters=constituentNetworkParameters,
                              compositeNetworkParameters=compositeNetworkParameters,
@@ -1,37 +1,17 @@
 import numpy as np
+from timeseries import Window as window
 class TimeSeriesProcessor:
 
-    def __init__(self, inputData, depth, horizon):
+    def __init__(self, inputData, depth, horizon, copy=False):
         self.inputData = inputData
         self.horizon = horizon
         self.depth = depth
+        self.copy = copy
 
     def __generate__(self):
-        # Create the dataset as numpy array
-        rowCount = self.inputData.shape[0] - self.depth - self.horizon + 1
-        colCount = self.depth + self.horizon #1 for current value
-        processedData = np.zeros((rowCount, colCount))
-
-        index = self.depth
-        dataCount = 0
-        while index <= (self.inputData.shape[0] - self.horizon):
-            # Past values - including current
-            depthValues = range(self.depth, 0, -1)
-            colCount = 0
-            for depth in depthValues:
-                processedData[dataCount, colCount] = self.inputData[index - depth]
-                colCount += 1
-
-            # Future values
-            horizonValues = range(0, self.horizon, 1)
-            for horizon in horizonValues:
-                processedData[dataCount, colCount] = self.inputData[index + horizon]
-                colCount += 1
-
-            index += 1
-            dataCount += 1
-
-        return processedData
+        # Each row - the depth past values (including current) followed by the horizon future values. The rows are
+        # a read-only view on the input data unless copy is set
+        return window.slidingWindows(self.inputData, self.depth + self.horizon, copy=self.copy)
 
     def getProcessedData(self):
         return self.__generate__()
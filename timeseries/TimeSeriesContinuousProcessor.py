@@ -1,35 +1,20 @@
-import numpy as np
 import pandas as pd
+from timeseries import Window as window
 class TimeSeriesContinuosProcessor:
 
-    def __init__(self, series, depth, horizon):
+    def __init__(self, series, depth, horizon, copy=False):
         self.series = series
         self.depth = depth
         self.horizon = horizon
+        self.copy = copy
 
     def __generate__(self):
-
-        data = self.series.values
-        trainingVectors = []
-
+        # Every window of depth + horizon values, in chronological order - the feature and target vectors are
+        # read-only views on the series unless copy is set
+        values = self.series.values
         size = self.depth + self.horizon
-        for i in range(size):
-            # Lose the last few elements (for re-shaping)
-            loseCount =  data.shape[0] % (size)
-            b = data[:data.shape[0]-loseCount]
-
-            # Reshape and form feature vectors
-            b = b.reshape((data.shape[0] / size, size)).tolist()
-            trainingVectors.extend(b)
-
-            # Move the array (like sliding window)
-            data = data[1:]
-
-        # Separate the feature and target vectors
-        trainingArray = np.array(trainingVectors)
-        featureVectors = trainingArray[:,:self.depth]
-        targetVectors = trainingArray[:,self.depth:]
-
+        featureVectors = window.slidingWindows(values, size, columns=slice(0, self.depth), copy=self.copy)
+        targetVectors = window.slidingWindows(values, size, columns=slice(self.depth, size), copy=self.copy)
         return featureVectors, targetVectors
 
     def getProcessedData(self):
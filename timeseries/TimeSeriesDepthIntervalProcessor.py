@@ -1,29 +1,24 @@
 import numpy as np
 import pandas as pd
+from timeseries import Window as window
 class TimeSeriesDepthIntervalProcessor:
 
-    def __init__(self, data, depth, period):
+    def __init__(self, data, depth, period, copy=False):
         self.data = data
         self.depth = depth
         self.period = period
+        self.copy = copy
 
     def __generate__(self):
-        data = self.data
-
-        d = self.depth
-        p = self.period
-
-        feature = np.empty((0,p+1), float)
-
-        totalSize = data.shape[0]
-        loseSize = data.shape[0] % d
-        temp = data[:data.shape[0] - loseSize]
-
-        temp = temp.reshape((d,int(data.shape[0]/d))).T
-        print(temp.shape)
-        feature = np.vstack((feature, temp))
-
-        print(feature)
+        # The feature vector of a value - the depth values one, two, ... period(s) before it (eg. the same hour of
+        # the previous depth days with a period of 24), oldest first. The target vector - the value itself.
+        # A window spans depth periods and the step of period picks the features and the target out of it, so
+        # both are read-only views on the data unless copy is set
+        size = self.depth * self.period + 1
+        featureVectors = window.slidingWindows(self.data, size, columns=slice(0, size - 1, self.period),
+                                               copy=self.copy)
+        targetVectors = window.slidingWindows(self.data, size, columns=slice(size - 1, size), copy=self.copy)
+        return featureVectors, targetVectors
 
     def getProcessedData(self):
         return self.__generate__()
@@ -3,53 +3,38 @@ import pandas as pd
 class TimeSeriesIntervalProcessor:
 
     def __init__(self, series, featureIntervalList, targetIntervalList):
+        """
+        :param series: the series - its index must be unique (one value per timestamp)
+        :param featureIntervalList: offsets (pd.Timedelta) of the feature values from each timestamp
+        :param targetIntervalList: offsets of the target values
+        """
         self.series = series
         self.targetIntervalList = targetIntervalList
         self.featureIntervalList = featureIntervalList
 
-    def __generate__(self):
-
-        featureVectors = []
-        targetVectors = []
-
-        # Now, for each index in indices, form the feature and target vector
-        for index in self.series.index:
+    def __positions(self, intervalList):
+        # Position in the series of index + interval for every index (columns) - -1 where that time is not in the series
+        if not self.series.index.is_unique:
+            duplicate = self.series.index[self.series.index.duplicated()][0]
+            raise ValueError("The series has duplicate timestamps (eg. " + str(duplicate) + ") - aggregate them first, "
+                             "eg. with series.groupby(level=0).sum() or a resample")
+        positions = np.empty((self.series.shape[0], len(intervalList)), dtype=np.intp)
+        for column, interval in enumerate(intervalList):
+            positions[:, column] = self.series.index.get_indexer(self.series.index + interval)
+        return positions
 
-            feature = []
-            target = []
-            missingFeature = False
-            missingTarget = False
-            #Feature vector
-            for interval in self.featureIntervalList:
-                intervalIndex = index+interval
-                if(intervalIndex in self.series.index):
-                    valueAtInterval = self.series[intervalIndex]
-                    feature.append(valueAtInterval)
-                else:
-                    missingFeature = True
-                    break
-
-
-            #Target vector
-            for interval in self.targetIntervalList:
-                intervalIndex = index+interval
-                if(intervalIndex in self.series.index):
-                    valueAtInterval = self.series[index+interval]
-                    target.append(valueAtInterval)
-                else:
-                    missingTarget = False
-                    break
+    def __generate__(self):
 
+        # Positions of the feature and target values of every index - one indexer lookup per interval
+        featurePositions = self.__positions(self.featureIntervalList)
+        targetPositions = self.__positions(self.targetIntervalList)
 
-            if(not missingFeature and not missingTarget):
-                feature = np.array(feature).reshape(1, len(feature))
-                featureVectors.append(feature)
-                target = np.array(target).reshape(1, len(target))
-                targetVectors.append(target)
+        # Keep the indices for which all the feature and target times exist
+        complete = np.all(featurePositions >= 0, axis=1) & np.all(targetPositions >= 0, axis=1)
 
-        #Convert to numpy array
-        featureVectors = np.array(featureVectors).reshape((len(featureVectors)), len(self.featureIntervalList))
-        targetVectors = np.array(targetVectors).reshape((len(targetVectors)), len(self.targetIntervalList))
+        values = self.series.values
+        featureVectors = values[featurePositions[complete]]
+        targetVectors = values[targetPositions[complete]]
 
         return featureVectors, targetVectors
 
@@ -0,0 +1,32 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Sliding windows of a series as a strided view - window i is data[i:i+size], the rows share the memory of the
+# series, so a feature matrix takes no extra memory however deep the windows are.
+
+
+def slidingWindows(data, size, columns=None, copy=False):
+    """
+    :param data: 1-D array (or pandas Series) of the values
+    :param size: number of values in a window
+    :param columns: the columns of the windows kept - a slice (eg. slice(0, depth)) keeps a view, a list of column
+                    indices gathers them into a new array
+    :param copy: return a writable copy instead of the view
+    :return: (len(data) - size + 1) X size windows, in chronological order - read-only unless copied
+    """
+    data = np.asarray(data)
+    if data.ndim != 1:
+        raise ValueError("The windows are taken over 1-D data, the data has shape " + str(data.shape))
+    if size < 1:
+        raise ValueError("The window size must be positive, got " + str(size))
+
+    stride = data.strides[0]
+    windows = as_strided(data, shape=(max(data.shape[0] - size + 1, 0), size), strides=(stride, stride),
+                         writeable=False)
+
+    if columns is not None:
+        if isinstance(columns, slice):
+            windows = windows[:, columns]
+        else:
+            return windows[:, np.asarray(columns, dtype=int)]
+    return np.array(windows) if copy else windows
@@ -0,0 +1,30 @@
+import numpy as np
+from scipy.stats import rankdata
+
+# Correlation of every feature column with the target at once - the target is ranked (and centred) once, the
+# columns are ranked chunk by chunk, and the coefficients of a chunk are one matrix-vector product. Same values as
+# calling pearsonr / spearmanr per column.
+
+
+def correlations(featureVectors, target, rank=False, chunkSize=128):
+    """
+    :param featureVectors: N X F feature vectors (any array, eg. a read-only window view)
+    :param target: N target values
+    :param rank: Spearman (rank) correlation instead of Pearson
+    :param chunkSize: number of columns ranked and centred at a time - bounds the temporary memory to N X chunkSize
+    :return: the F correlation coefficients - NaN for constant columns
+    """
+    target = np.asarray(target, dtype=np.float64).ravel()
+    if rank:
+        target = rankdata(target)
+    target = target - target.mean()
+    target /= np.linalg.norm(target)
+
+    coefficients = np.empty(featureVectors.shape[1])
+    for start in range(0, featureVectors.shape[1], chunkSize):
+        chunk = featureVectors[:, start:start + chunkSize]
+        chunk = rankdata(chunk, axis=0) if rank else np.array(chunk, dtype=np.float64)
+        chunk -= chunk.mean(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            coefficients[start:start + chunk.shape[1]] = target.dot(chunk) / np.linalg.norm(chunk, axis=0)
+    return coefficients
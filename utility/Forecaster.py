@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+# Recursive (closed-loop) forecasting of an hourly series with plain arrays - the lag window is a fixed size ring
+# buffer, the predictions go into a preallocated array, and the DatetimeIndex is attached once at the end instead of
+# growing a pandas Series one element per step.
+
+
+class RingBuffer(object):
+    def __init__(self, history, capacity):
+        """
+        :param history: the known values, oldest first - the last capacity of them are kept
+        :param capacity: the largest lag the buffer is read at
+        """
+        history = np.asarray(history, dtype=np.float64)
+        if history.shape[0] < capacity:
+            raise ValueError("The series has " + str(history.shape[0]) + " values, the lags need " + str(capacity))
+        self.capacity = capacity
+        self.buffer = np.array(history[history.shape[0] - capacity:])
+        # Position of the next write - the oldest value
+        self.head = 0
+
+    def append(self, value):
+        self.buffer[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+
+    def lags(self, lags, out=None):
+        """
+        :param lags: positive lags - 1 is the latest value
+        :return: the value at each lag
+        """
+        return np.take(self.buffer, (self.head - lags) % self.capacity, out=out)
+
+
+def lagsOfIntervals(featureIntervalList, frequency=pd.Timedelta(hours=1)):
+    # Negative Timedelta offsets (eg. -24 hours) to positive lags in steps of the frequency
+    return np.array([int(round(-interval / frequency)) for interval in featureIntervalList], dtype=int)
+
+
+def forecast(predictNext, availableSeries, lags, horizon, bias=True, frequency=pd.Timedelta(hours=1)):
+    """
+    Predicts horizon steps after the last valid value of the series, feeding every prediction back as the latest value
+
+    :param predictNext: predictNext(feature) - the next value for a 1 X F feature vector
+    :param availableSeries: the known series, on a regular grid of the frequency
+    :param lags: the lag of each feature (1 = the latest value)
+    :param horizon: number of steps
+    :param bias: prepend a constant 1.0 to the features
+    :return: pd.Series of the predictions, indexed from one step after the last valid index of the series
+    """
+    lags = np.asarray(lags, dtype=int)
+    lastIndex = availableSeries.last_valid_index()
+    buffer = RingBuffer(availableSeries[:lastIndex].values, int(np.max(lags)))
+
+    offset = 1 if bias else 0
+    feature = np.ones((1, lags.shape[0] + offset))
+    predictions = np.zeros(horizon)
+    for i in range(horizon):
+        buffer.lags(lags, out=feature[0, offset:])
+        predictions[i] = predictNext(feature)
+        buffer.append(predictions[i])
+
+    index = pd.date_range(lastIndex + frequency, periods=horizon, freq=frequency)
+    return pd.Series(data=predictions, index=index)
@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
-from timeseries import TimeSeriesContinuousProcessor as processor, TimeSeriesInterval as tsi
-from reservoir import classicESN as esn, ReservoirTopology as topology
+from timeseries import TimeSeriesContinuousProcessor as processor, TimeSeriesInterval as tsi, Window as window
+from reservoir import classicESN as esn, ReservoirTopology as topology, Parallel as parallel
+from utility import Forecaster as forecaster, Correlation as correlation
 from sklearn import preprocessing as pp
 import os
 from plotting import OutputTimeSeries as plotting
@@ -10,7 +11,6 @@ from performance import ErrorMetrics as metrics
 from enum import Enum
 import gc
 from scipy import optimize
-from scipy.stats import pearsonr, spearmanr
 import operator
 
 class Minimizer(Enum):
@@ -29,13 +29,13 @@ class ParameterStep(object):
         x += self.stepsize
         return x
 
-class ReservoirParameterTuner:
+class ReservoirParameterTuner(parallel.SharesArrays):
     def __init__(self, size, initialTransient, trainingInputData, trainingOutputData,
                  initialSeedSeries, validationOutputData, arbitraryDepth, featureIndices,
                  spectralRadiusBound, inputScalingBound,
                  reservoirScalingBound, leakingRateBound,inputWeightMatrix=None,
                  reservoirWeightMatrix=None, minimizer=Minimizer.DifferentialEvolution,
-                 initialGuess = np.array([0.79, 0.5, 0.5, 0.3])):
+                 initialGuess = np.array([0.79, 0.5, 0.5, 0.3]), workers=1, seed=None):
         self.size = size
         self.initialTransient = initialTransient
         self.trainingInputData = trainingInputData
@@ -51,6 +51,8 @@ class ReservoirParameterTuner:
         self.horizon = self.validationOutputData.shape[0]
         self.minimizer = minimizer
         self.initialGuess = initialGuess
+        self.workers = workers
+        self.seed = seed
 
         if inputWeightMatrix is None:
             self.inputN, self.inputD = self.trainingInputData.shape
@@ -106,28 +108,27 @@ class ReservoirParameterTuner:
         return regressionError
 
     def predict(self, network, availableSeries, arbitraryDepth, horizon, featureIndices):
-        # To avoid mutation of pandas series
-        initialSeries = pd.Series(data=availableSeries.values, index=availableSeries.index)
-        for i in range(horizon):
-            feature = initialSeries.values[-arbitraryDepth:].reshape((1, arbitraryDepth))
-            feature = feature[:, featureIndices]
-
-            #Append bias
-            feature = np.hstack((1.0,feature[0, :])).reshape((1, feature.shape[1]+1))
-
-            nextPoint = network.predictOnePoint(feature)[0]
-
-            nextIndex = initialSeries.last_valid_index() + pd.Timedelta(hours=1)
-            initialSeries[nextIndex] = nextPoint
-
-        predictedSeries = initialSeries[-horizon:]
-        return predictedSeries
-
+        # Feature index j of the depth window is the value arbitraryDepth - j steps back
+        lags = arbitraryDepth - np.asarray(featureIndices, dtype=int)
+        return forecaster.forecast(lambda feature: network.predictOnePoint(feature)[0], availableSeries, lags, horizon)
+
+
+    def __differentialEvolution__(self, bounds):
+        # Same as in EnhancedClassicTuner - deferred updating, so that the serial and parallel runs agree
+        if self.workers <= 1:
+            return optimize.differential_evolution(self.__reservoirTrain__, bounds=bounds, maxiter=1, seed=self.seed, updating='deferred')
+        self.shareArrays()
+        try:
+            with parallel.WorkerPool(self.workers, self.__reservoirTrain__) as pool:
+                return optimize.differential_evolution(parallel.evaluate, bounds=bounds, maxiter=1, seed=self.seed,
+                                                       updating='deferred', workers=pool.map)
+        finally:
+            self.releaseArrays()
 
     def __tune__(self):
         if self.minimizer == Minimizer.DifferentialEvolution:
             bounds = [self.spectralRadiusBound, self.inputScalingBound, self.reservoirScalingBound, self.leakingRateBound]
-            result = optimize.differential_evolution(self.__reservoirTrain__,bounds=bounds, maxiter=1)
+            result = self.__differentialEvolution__(bounds)
             print("The Optimization results are :"+str(result))
             return result.x[0], result.x[1], result.x[2], result.x[3]
         else:
@@ -294,6 +295,23 @@ class SeriesUtility:
 
         return featureVectors, targetVectors
 
+    def formSelectedFeatureAndTargetVectors(self, series, depth, featureIndices, bias=True):
+        """
+        The columns featureIndices of formContinousFeatureAndTargetVectorsWithoutBias(series, depth) - gathered from
+        the windows of the series in one pass, so only the selected lags are materialised
+
+        :param featureIndices: indices into the depth window (index j is the value depth - j steps back)
+        :param bias: prepend the bias column of ones
+        """
+        featureIndices = np.asarray(featureIndices, dtype=int)
+        windows = window.slidingWindows(series.values, depth + 1)
+        offset = 1 if bias else 0
+        featureVectors = np.empty((windows.shape[0], featureIndices.shape[0] + offset))
+        featureVectors[:, :offset] = 1.0
+        np.take(windows, featureIndices, axis=1, out=featureVectors[:, offset:])
+        targetVectors = windows[:, depth:]
+        return featureVectors, targetVectors
+
 
     def trainESNWithoutTuning(self, size, featureVectors, targetVectors, initialTransient,
                               inputConnectivity=0.7, reservoirConnectivity=0.1, inputScaling=0.5,
@@ -326,7 +344,7 @@ class SeriesUtility:
 
     def trainESNWithTuning(self, size, featureVectors, targetVectors, initialTransient,
                        initialSeedSeries, validationOutputData, arbitraryDepth, featureIndices,
-                       inputConnectivity=1.0, reservoirConnectivity=0.5):
+                       inputConnectivity=1.0, reservoirConnectivity=0.5, workers=1, seed=None):
 
         inputWeightMatrix = topology.RandomInputTopology(inputSize=featureVectors.shape[1], reservoirSize=size, inputConnectivity=inputConnectivity).generateWeightMatrix()
         reservoirWeightMatrix = topology.RandomReservoirTopology(size=size, connectivity=reservoirConnectivity).generateWeightMatrix()
@@ -339,7 +357,8 @@ class SeriesUtility:
                                            spectralRadiusBound=(0.0,1.0), inputScalingBound=(0.0,1.0),
                                            reservoirScalingBound=(0.0,1.0), leakingRateBound=(0.0,1.0),
                                            inputWeightMatrix=inputWeightMatrix, reservoirWeightMatrix=reservoirWeightMatrix,
-                                           minimizer=Minimizer.DifferentialEvolution)
+                                           minimizer=Minimizer.DifferentialEvolution,
+                                           workers=workers, seed=seed)
         spectralRadiusOptimum, inputScalingOptimum, reservoirScalingOptimum, leakingRateOptimum = resTuner.getOptimalParameters()
 
 
@@ -367,102 +386,25 @@ class SeriesUtility:
 
 
     def predictFuture(self, availableSeries, depth, horizon):
-
-        # future series
-        futureSeries = pd.Series()
-
-        # Feature list
-        featureIntervalList = []
-        for i in range(depth, 0, -1):
-            interval = pd.Timedelta(hours=-(i))
-            featureIntervalList.append(interval)
-
-        nextValue = availableSeries.last_valid_index()
-        for i in range(horizon):
-            nextValue = nextValue + pd.Timedelta(hours=1)
-
-            #Form the feature vectors
-            feature = [1.0]
-            for interval in featureIntervalList:
-                feature.append(availableSeries[nextValue + interval])
-
-            feature = np.array(feature).reshape((1,len(featureIntervalList)+1))
-
-            predictedValue = self.esn.predict(feature)[0,0]
-
-            # Add to the future list
-            futureSeries[nextValue] = predictedValue
-
-            # Add it to the series
-            availableSeries[nextValue] = predictedValue
-
-        return futureSeries
+        # The features are the last depth values, oldest first
+        lags = np.arange(depth, 0, -1)
+        return forecaster.forecast(lambda feature: self.esn.predict(feature)[0,0], availableSeries, lags, horizon)
 
     def predictFutureWithPCA(self, availableSeries, depth, horizon, pca):
 
-        # future series
-        futureSeries = pd.Series()
-
-        # Feature list
-        featureIntervalList = []
-        for i in range(depth, 0, -1):
-            interval = pd.Timedelta(hours=-(i))
-            featureIntervalList.append(interval)
-
-        nextValue = availableSeries.last_valid_index()
-        for i in range(horizon):
-            nextValue = nextValue + pd.Timedelta(hours=1)
-
-            # Form the feature vectors
-            feature = []
-            for interval in featureIntervalList:
-                feature.append(availableSeries[nextValue + interval])
-
-            feature = np.array(feature).reshape((1,len(featureIntervalList)))
-
-            # Transform the feature vector into PCA reduced dimensions
+        def predictNext(feature):
+            # Transform the feature vector into PCA reduced dimensions and add the bias
             feature = pca.transform(feature)
-            featureLen = feature.shape[1]
-
-            # Add the bias
-            feature = np.hstack((1.0,feature[0, :])).reshape((1, featureLen+1))
-
-            predictedValue = self.esn.predict(feature)[0,0]
-
-            # Add to the future list
-            futureSeries[nextValue] = predictedValue
-
-            # Add it to the series
-            availableSeries[nextValue] = predictedValue
+            feature = np.hstack((1.0,feature[0, :])).reshape((1, feature.shape[1]+1))
+            return self.esn.predict(feature)[0,0]
 
-        return futureSeries
+        lags = np.arange(depth, 0, -1)
+        return forecaster.forecast(predictNext, availableSeries, lags, horizon, bias=False)
 
 
     def predictFutureWithFeatureInterval(self, availableSeries, featureIntervalList, horizon):
-
-        # future series
-        futureSeries = pd.Series()
-
-        nextValue = availableSeries.last_valid_index()
-        for i in range(horizon):
-            nextValue = nextValue + pd.Timedelta(hours=1)
-
-            # Form the feature vectors
-            feature = [1.0]
-            for interval in featureIntervalList:
-                feature.append(availableSeries[nextValue + interval])
-
-            feature = np.array(feature).reshape((1,len(featureIntervalList)+1))
-
-            predictedValue = self.esn.predict(feature)[0,0]
-
-            # Add to the future list
-            futureSeries[nextValue] = predictedValue
-
-            # Add it to the series
-            availableSeries[nextValue] = predictedValue
-
-        return futureSeries
+        lags = forecaster.lagsOfIntervals(featureIntervalList)
+        return forecaster.forecast(lambda feature: self.esn.predict(feature)[0,0], availableSeries, lags, horizon)
 
 
     def plotSeries(self, folderName, seriesList, seriesNameList, title, subTitle, fileName="Prediction.html"):
@@ -495,18 +437,12 @@ class SeriesUtility:
         featureVectors, targetVectors = self.formContinousFeatureAndTargetVectorsWithoutBias(series, depth)
 
         features = []
-        y = targetVectors[:, 0]
-        correlations = []
-        # For each feature vector, calculate the correlation coefficient
-        for i in range(featureVectors.shape[1]):
-            x = featureVectors[:, i]
-            correlation, p_value = pearsonr(x,y)
-            correlations.append(abs(correlation))
+        # The correlation coefficient of each feature vector
+        correlations = np.abs(correlation.correlations(featureVectors, targetVectors[:, 0]))
 
         # Scale the correlations
-        correlations = np.array(correlations)
         scaler = pp.MinMaxScaler((0,1))
-        correlations = scaler.fit_transform(correlations)
+        correlations = scaler.fit_transform(correlations.reshape((-1, 1))).flatten()
 
 
         # Get the best ones
@@ -517,19 +453,12 @@ class SeriesUtility:
         return features
 
     def getCorrelationCoefficients(self, featureVectors, targetVectors):
-        correlations = []
-        y = targetVectors[:, 0]
-        # For each feature vector, calculate the correlation coefficient
-        for i in range(featureVectors.shape[1]):
-            x = featureVectors[:, i]
-            #correlation, p_value = pearsonr(x,y)
-            correlation, p_value = spearmanr(x,y)
-            correlations.append(abs(correlation))
+        # The rank correlation coefficient of each feature vector
+        correlations = np.abs(correlation.correlations(featureVectors, targetVectors[:, 0], rank=True))
 
         # Scale the correlations
-        correlations = np.array(correlations)
         scaler = pp.MinMaxScaler((0,1))
-        correlations = scaler.fit_transform(correlations)
+        correlations = scaler.fit_transform(correlations.reshape((-1, 1))).flatten()
 
         # Re-shape
         correlations = correlations.reshape((1, featureVectors.shape[1]))
@@ -580,22 +509,9 @@ class SeriesUtility:
         return predictedSeries
 
     def predict(self, network, availableSeries, arbitraryDepth, horizon, featureIndices):
-        # To avoid mutation of pandas series
-        initialSeries = pd.Series(data=availableSeries.values, index=availableSeries.index)
-        for i in range(horizon):
-            feature = initialSeries.values[-arbitraryDepth:].reshape((1, arbitraryDepth))
-            feature = feature[:, featureIndices]
-
-            #Append bias
-            feature = np.hstack((1.0,feature[0, :])).reshape((1, feature.shape[1]+1))
-
-            nextPoint = network.predictOnePoint(feature)[0]
-
-            nextIndex = initialSeries.last_valid_index() + pd.Timedelta(hours=1)
-            initialSeries[nextIndex] = nextPoint
-
-        predictedSeries = initialSeries[-horizon:]
-        return predictedSeries
+        # Feature index j of the depth window is the value arbitraryDepth - j steps back
+        lags = arbitraryDepth - np.asarray(featureIndices, dtype=int)
+        return forecaster.forecast(lambda feature: network.predictOnePoint(feature)[0], availableSeries, lags, horizon)
 
     def getBestLeakingRate(self,featureIndices, depth, featureVectors, targetVectors, availableSeries, validationSeries, networkParamaters):
         bestError = np.inf
@@ -639,11 +555,11 @@ class SeriesUtility:
             bestFeatures = None
             bestError = np.inf
             for i in thresholdRange:
-                features, indices = self.getFeaturesForThreshold(featureVectors, correlationCoefficients, i)
-                features = np.hstack((np.ones((features.shape[0], 1)), features))
+                indices = np.where(correlationCoefficients.flatten() >= i)[0]
+                features, _ = self.formSelectedFeatureAndTargetVectors(trainingSeries, maxDepth, indices)
 
                 # Train the network and get the predicted Series
-                predictedSeries = self.trainAndPredict(trainingSeries, indices, features, targetVectors, depth, horizon, networkParameters)
+                predictedSeries = self.trainAndPredict(trainingSeries, indices, features, targetVectors, maxDepth, horizon, networkParameters)
 
                 # Measure the error between predicted series and validation series
                 validationError = errorFun.compute(validationSeries.values, predictedSeries.values)
@@ -695,8 +611,7 @@ class SeriesUtility:
 
                     # Form the features
                     indices = self.getFeatureIndices(bestBins)
-                    features = featureVectors[:, indices]
-                    features = np.hstack((np.ones((features.shape[0], 1)), features))
+                    features, _ = self.formSelectedFeatureAndTargetVectors(trainingSeries, depth, indices)
 
                     # Train the network and get the predicted Series
                     predictedSeries = self.trainAndPredict(trainingSeries, indices, features, targetVectors, depth, horizon, networkParameters)